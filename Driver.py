@@ -1,34 +1,117 @@
 """ Driver.py """
 
+import os
+import random
+import contextlib
+import concurrent.futures
+
+import numpy as np
 import simpy
 
 from . import Globals
 from . import Simulator
 from . import ProgressBar
 from . import TraceUtils
+from . import FastSim
+from . import EventQueue
+from . import Utils
+from . import PacketIds
 
 
-def run_sim(M, t, output_dir=None, bar=False, verbose=Globals.VERB_NO):
-    """ Runs network simulation based on the network model 'M' """
+def run_sim(M, t, output_dir=None, bar=False, verbose=Globals.VERB_NO,
+            channel_mode=Globals.CHANNEL_DELAY_LINE, recv_mode=Globals.RECV_CALLBACK,
+            engine=Globals.ENGINE_SIMPY, scheduler=Globals.SCHEDULER_HEAP, seed=None,
+            replication=0, queue_mon_deltat=None, stream_traces=False,
+            trace_format=Globals.TRACE_FORMAT_CSV, link_events=None):
+    """
+        Runs network simulation based on the network model 'M'.
+        The node random streams are derived from 'seed' (see RandomStreams),
+        and packet IDs are namespaced by 'replication' (see PacketIds).
+        Queue monitors are saved at their change points, or resampled every
+        'queue_mon_deltat' time units if it is given (see QueueMonitor).
+        With 'stream_traces', traces are written to 'output_dir' while the
+        simulation runs rather than kept in memory until it ends.
+        Traces are saved as CSV text or, with trace_format="binary", as
+        binary columnar files (see TraceWriter, TraceUtils.load_binary_trace);
+        trace_format="container" saves them all in a single binary file
+        (see TraceReader).
+        Links go down and come back up as scheduled in 'link_events', a list
+        of (time, node 1, node 2, state) tuples with the state "down" or "up";
+        routes are updated around them as they happen (see Routing).
+        The 'engine' is SimPy, or the fast kernel (see FastSim), which only
+        reproduces the Round Robin component.
+        Returns the simulated network (node name -> node).
+    """
 
     print(" [+] Initialising the simulation...")
     print(" [+] Total simulation time is {:.2f} time units".format(t))
 
-    # initialise simpy environment
-    env = simpy.Environment()
+    if stream_traces and output_dir is None:
+        Utils.error("Streaming traces requires an output directory")
+    if stream_traces and queue_mon_deltat is not None:
+        Utils.error("Queue monitors cannot be resampled when traces are streamed")
 
-    # bind the network model 'M' to the SimPy simulation environment
-    network = Simulator.setup_network(env, M, verbose=verbose)
-    print(" [+] Simulations started...")
+    # trace container, with the container trace format
+    container = None
 
-    # show progress bar
-    if bar:
-        print("\n [ Running progress bar ]")
-        progress_bar = ProgressBar.setup(env, t)
-        progress_bar.run()
+    # seed the remaining draws from the 'random' module as well
+    if seed is not None:
+        random.seed(seed)
+
+    # links taken down during the run are brought back up even if the run fails,
+    # so that the model is left with all its links up for the next run
+    try:
+
+        if engine == Globals.ENGINE_SIMPY:
+
+            # initialise simpy environment, on the event list 'scheduler'
+            if scheduler == Globals.SCHEDULER_HEAP:
+                env = simpy.Environment()
+            else:
+                env = EventQueue.QueueEnvironment(EventQueue.make_queue(scheduler))
+
+            # bind the network model 'M' to the SimPy simulation environment
+            network = Simulator.setup_network(env, M, verbose=verbose, channel_mode=channel_mode,
+                                              recv_mode=recv_mode, seed=seed,
+                                              replication=replication, link_events=link_events)
+
+            # write the traces while the simulation runs
+            if stream_traces:
+                container = TraceUtils.stream_traces(network, output_dir, trace_format)
+
+            print(" [+] Simulations started...")
+
+            # show progress bar
+            if bar:
+                print("\n [ Running progress bar ]")
+                progress_bar = ProgressBar.setup(env, t)
+                progress_bar.run()
+
+            # run the simulation
+            env.run(until=t)
+
+        elif engine == Globals.ENGINE_FAST:
 
-    # run the simulation
-    env.run(until=t)
+            # bind the network model 'M' to the standalone event list kernel
+            fast_engine = FastSim.setup_network(M, t, verbose=verbose, scheduler=scheduler,
+                                                seed=seed, replication=replication,
+                                                link_events=link_events)
+            network = fast_engine.network
+
+            # write the traces while the simulation runs
+            if stream_traces:
+                container = TraceUtils.stream_traces(network, output_dir, trace_format)
+
+            # run the simulation
+            print(" [+] Simulations started...")
+            FastSim.run_engine(fast_engine, t, bar=bar)
+
+        else:
+            Utils.error("Simulation engine '{:s}' not implemented".format(engine))
+
+    finally:
+        if link_events:
+            M.restore_links()
 
     if bar:
         print("\n")
@@ -36,13 +119,107 @@ def run_sim(M, t, output_dir=None, bar=False, verbose=Globals.VERB_NO):
     print(" [+] Simulation completed")
 
     # print summary statistics
-    TraceUtils.print_stats(network, verbose=verbose)
+    TraceUtils.print_stats(network, verbose=verbose, until=t)
 
-    # if 'output_dir' is defined, save node names, queue monitor, and traces
-    if output_dir is not None:
+    # if 'output_dir' is defined, save node names, queue monitor, and traces;
+    # a trace container holds the node names itself
+    if output_dir is not None and trace_format != Globals.TRACE_FORMAT_CONTAINER:
         TraceUtils.save_node_names(network, output_dir)
-        TraceUtils.save_queue_mon(output_dir, network)
+
+    if stream_traces:
+        TraceUtils.close_streams(network, container)
+    elif output_dir is not None:
+        if trace_format == Globals.TRACE_FORMAT_CONTAINER:
+            container = TraceUtils.open_container(network, output_dir)
+
+        TraceUtils.save_queue_mon(output_dir, network, deltat=queue_mon_deltat, until=t,
+                                  trace_format=trace_format, container=container)
 
         # save generated, forwarded, received, discarded packets
         for trace in ['g', 'f', 'r', 'd']:
-            TraceUtils.save_node_pkts(network, output_dir, trace)
+            TraceUtils.save_node_pkts(network, output_dir, trace, trace_format, container)
+
+        if container is not None:
+            container.close()
+
+    return network
+
+
+# Network model of the replications run by a worker process (see init_worker())
+worker_model = None
+
+
+def run_replications(M, t, n, jobs=1, seed=None, confidence=Globals.CONFIDENCE_LEVEL, **kwargs):
+    """
+        Runs 'n' independent replications of the simulation of the network
+        model 'M' for 't' time units, 'jobs' at a time in worker processes
+        (all the processors with jobs=None). Replication k is seeded with
+        its own seed spawned from 'seed' (see replication_seeds()) and runs
+        with replication=k; the other keyword arguments are passed on to
+        run_sim(), which runs silently and without saving traces. Workers
+        only send back the summary statistics of their runs (see
+        TraceUtils.summary_stats()). Prints their means with 'confidence'
+        confidence intervals, and returns them (see
+        TraceUtils.print_replication_stats()) with the list of the summary
+        statistics of every replication.
+    """
+
+    if kwargs.get('output_dir') is not None or kwargs.get('stream_traces'):
+        Utils.error("Replications do not save traces")
+
+    print(" [+] Running {:d} replications of {:.2f} time units".format(n, t))
+
+    tasks = []
+    for k, replication_seed in enumerate(replication_seeds(seed, n)):
+        tasks.append((t, replication_seed, k, kwargs))
+
+    if jobs == 1:
+        init_worker(M)
+        stats = list(map(run_replication, tasks))
+    else:
+        # the model is sent once to each worker, not once per replication
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                                    initargs=(M,)) as pool:
+            stats = list(pool.map(run_replication, tasks))
+
+    summary = TraceUtils.print_replication_stats(stats, confidence)
+
+    return summary, stats
+
+
+def replication_seeds(seed, n):
+    """
+        Seeds of 'n' independent replications, spawned from 'seed' (from OS
+        entropy with seed=None), as for the node streams (see RandomStreams);
+        replication numbers must fit in packet IDs (see PacketIds)
+    """
+
+    if n > PacketIds.REPLICATION_MASK + 1:
+        Utils.error("At most {:d} replications can be run".format(PacketIds.REPLICATION_MASK + 1))
+
+    seeds = []
+    for child in np.random.SeedSequence(seed).spawn(n):
+        seeds.append(int(child.generate_state(1, dtype=np.uint64)[0]))
+
+    return seeds
+
+
+def init_worker(M):
+    """ Sets the network model of the replications run by this process """
+
+    global worker_model
+    worker_model = M
+
+
+def run_replication(task):
+    """
+        Runs the replication 'task', a (t, seed, replication, run_sim()
+        keyword arguments) tuple, silently; returns its summary statistics
+    """
+
+    t, seed, replication, kwargs = task
+
+    with open(os.devnull, "w") as fp, contextlib.redirect_stdout(fp):
+        network = run_sim(worker_model, t, seed=seed, replication=replication, **kwargs)
+
+    return TraceUtils.summary_stats(network, until=t)
@@ -0,0 +1,255 @@
+""" EventQueue.py """
+
+import bisect
+import heapq
+import math
+import random
+import time
+
+import simpy
+
+from . import Globals
+from . import Utils
+
+
+def make_queue(scheduler):
+    """ Returns an empty event list of the kind 'scheduler' """
+
+    if scheduler == Globals.SCHEDULER_HEAP:
+        queue = HeapQueue()
+    elif scheduler == Globals.SCHEDULER_CALENDAR:
+        queue = CalendarQueue()
+    else:
+        Utils.error("Event scheduler '{:s}' not implemented".format(scheduler))
+
+    return queue
+
+
+class HeapQueue:
+    """
+        Binary heap event list. Events are tuples whose first element is
+        the event time; ties are broken by the remaining tuple elements.
+    """
+
+    def __init__(self):
+
+        self.heap = []
+
+    def __len__(self):
+
+        return len(self.heap)
+
+    def push(self, item):
+        """ Adds the event 'item' """
+
+        heapq.heappush(self.heap, item)
+
+    def pop(self):
+        """ Removes and returns the earliest event """
+
+        return heapq.heappop(self.heap)
+
+    def peek(self):
+        """ Time of the earliest event, infinity if there are no events """
+
+        if len(self.heap) == 0:
+            return math.inf
+
+        return self.heap[0][0]
+
+
+class CalendarQueue:
+    """
+        Calendar queue event list (R. Brown, CACM 31(10), 1988).
+
+        Events are hashed by time into 'nbuckets' sorted buckets ("days")
+        of width 'width', so that enqueue and dequeue take O(1) on average.
+        The number of buckets doubles or halves with the number of events,
+        and the bucket width is then re-estimated from the spacing of the
+        earliest events. Events are tuples ordered as in HeapQueue.
+    """
+
+    # number of earliest events sampled to estimate the bucket width
+    WIDTH_SAMPLE = 25
+
+    def __init__(self, nbuckets=2, width=1.0):
+
+        self.size = 0
+        self.init_buckets(nbuckets, width, 0)
+
+    def __len__(self):
+
+        return self.size
+
+    def init_buckets(self, nbuckets, width, vbucket):
+        """ Creates 'nbuckets' empty buckets of width 'width' """
+
+        self.nbuckets = nbuckets
+        self.width = width
+        self.buckets = [[] for _ in range(nbuckets)]
+
+        # virtual bucket, int(time / width), where the next dequeue starts
+        self.vbucket = vbucket
+
+        # resize thresholds
+        self.grow_size = 2 * nbuckets
+        self.shrink_size = nbuckets // 2 - 2
+
+    def push(self, item):
+        """ Adds the event 'item' """
+
+        vbucket = int(item[0] / self.width)
+        bisect.insort(self.buckets[vbucket % self.nbuckets], item)
+
+        if vbucket < self.vbucket:
+            self.vbucket = vbucket
+
+        self.size += 1
+        if self.size > self.grow_size:
+            self.resize(2 * self.nbuckets)
+
+    def find(self):
+        """ Returns the bucket and the virtual bucket of the earliest event """
+
+        buckets = self.buckets
+        nbuckets = self.nbuckets
+        width = self.width
+        vbucket = self.vbucket
+
+        # scan one "year" of buckets, starting from the current one
+        for _ in range(nbuckets):
+            bucket = buckets[vbucket % nbuckets]
+            if len(bucket) > 0 and int(bucket[0][0] / width) <= vbucket:
+                return bucket, vbucket
+            vbucket += 1
+
+        # no event within a year: search directly for the earliest one
+        first = min(bucket[0] for bucket in buckets if len(bucket) > 0)
+        vbucket = int(first[0] / width)
+
+        return buckets[vbucket % nbuckets], vbucket
+
+    def pop(self):
+        """ Removes and returns the earliest event """
+
+        if self.size == 0:
+            raise IndexError("pop from an empty calendar queue")
+
+        bucket, self.vbucket = self.find()
+        item = bucket.pop(0)
+
+        self.size -= 1
+        if self.size < self.shrink_size:
+            self.resize(self.nbuckets // 2)
+
+        return item
+
+    def peek(self):
+        """ Time of the earliest event, infinity if there are no events """
+
+        if self.size == 0:
+            return math.inf
+
+        bucket, _ = self.find()
+
+        return bucket[0][0]
+
+    def resize(self, nbuckets):
+        """ Rehashes all events into 'nbuckets' buckets of a re-estimated width """
+
+        items = []
+        for bucket in self.buckets:
+            items.extend(bucket)
+
+        width = self.new_width(heapq.nsmallest(self.WIDTH_SAMPLE, items))
+        self.init_buckets(max(2, nbuckets), width, 0)
+
+        if len(items) > 0:
+            self.vbucket = int(min(items)[0] / width)
+
+        for item in items:
+            bisect.insort(self.buckets[int(item[0] / width) % self.nbuckets], item)
+
+    def new_width(self, sample):
+        """ Bucket width from the average spacing of the (sorted) events 'sample' """
+
+        if len(sample) < 2:
+            return self.width
+
+        gaps = [sample[k + 1][0] - sample[k][0] for k in range(len(sample) - 1)]
+        mean_gap = sum(gaps) / len(gaps)
+
+        # average again, ignoring gaps that are much larger than the mean
+        gaps = [gap for gap in gaps if gap <= 2 * mean_gap]
+        mean_gap = sum(gaps) / len(gaps)
+
+        if mean_gap <= 0:
+            return self.width
+
+        return 3 * mean_gap
+
+
+class QueueEnvironment(simpy.Environment):
+    """ SimPy environment that keeps pending events in the event list 'queue' """
+
+    def __init__(self, queue, initial_time=0):
+
+        super().__init__(initial_time)
+        self.event_list = queue
+
+    def schedule(self, event, priority=simpy.core.NORMAL, delay=0):
+        """ Schedule an 'event' with a given 'priority' and a 'delay' """
+
+        self.event_list.push((self._now + delay, priority, next(self._eid), event))
+
+    def peek(self):
+        """ Time of the next scheduled event, infinity if there is none """
+
+        return self.event_list.peek()
+
+    def step(self):
+        """ Process the next event """
+
+        # hand the next event to simpy.Environment.step() through its heap,
+        # which otherwise stays empty
+        if len(self.event_list) > 0:
+            self._queue.append(self.event_list.pop())
+
+        super().step()
+
+
+def benchmark(sizes=(1000, 10000, 100000, 1000000), n_ops=200000, seed=1):
+    """
+        Compares event lists with the classic "hold" model: the list is
+        filled with 'size' events, then each hold operation pops the
+        earliest event and schedules a new one an exponential delay later.
+        Prints the mean time per hold operation for each event list size.
+    """
+
+    print(" [+] Hold model benchmark, {:,} operations per size".format(n_ops))
+    print("\n\t{:>10s} {:>14s} {:>14s} {:>8s}".format("size", "heap [us]", "calendar [us]", "ratio"))
+
+    for size in sizes:
+
+        times = []
+        for scheduler in [Globals.SCHEDULER_HEAP, Globals.SCHEDULER_CALENDAR]:
+
+            rng = random.Random(seed)
+            queue = make_queue(scheduler)
+            for seq in range(size):
+                queue.push((rng.expovariate(1.0), seq))
+
+            push = queue.push
+            pop = queue.pop
+            expovariate = rng.expovariate
+
+            start = time.perf_counter()
+            for seq in range(size, size + n_ops):
+                now = pop()[0]
+                push((now + expovariate(1.0), seq))
+            times.append((time.perf_counter() - start) / n_ops * 1e6)
+
+        print("\t{:>10,d} {:>14.3f} {:>14.3f} {:>8.2f}".format(size, times[0], times[1],
+                                                              times[0] / times[1]))
+
+    print("")
@@ -0,0 +1,409 @@
+""" FastSim.py """
+
+import collections      # provides 'deque': double-ended queue
+import math
+
+from . import Globals
+from . import Utils
+from . import PacketGenerator
+from . import ProgressBar
+from . import EventQueue
+from . import RandomStreams
+from . import Packet
+from . import PacketIds
+from . import TraceRecorder
+from . import QueueMonitor
+from . import Components
+
+
+# Event kinds
+EV_GEN = 0      # node generates a packet
+EV_RECV = 1     # packet leaves the wire at the receiving node
+EV_WAKE = 2     # idle forwarding process resumes
+EV_SEND = 3     # forwarding process is done processing a packet
+EV_BAR = 4      # progress bar update
+EV_LINK = 5     # link goes down or comes back up
+
+
+
+def run(M, t, bar=False, verbose=Globals.VERB_NO, scheduler=Globals.SCHEDULER_HEAP, seed=None,
+        replication=0, link_events=None):
+    """
+        Runs network model 'M' for 't' time units on the fast kernel, returns
+        the network. The kernel reproduces the Round Robin component only.
+    """
+
+    engine = setup_network(M, t, verbose, scheduler, seed, replication, link_events)
+    run_engine(engine, t, bar)
+
+    return engine.network
+
+
+def setup_network(M, t, verbose=Globals.VERB_NO, scheduler=Globals.SCHEDULER_HEAP, seed=None,
+                  replication=0, link_events=None):
+    """
+        Binds the network model 'M' to a fast kernel, returns the kernel (see run_engine()).
+        Links go down and come back up as scheduled in 'link_events' (see Simulator.setup_network()).
+        The kernel reproduces the Round Robin component only, and takes its user
+        nodes, server nodes and packet types from it; other components are refused.
+    """
+
+    if not getattr(Components, "FAST_ENGINE", False):
+        Utils.error("The fast engine only reproduces the Round Robin component")
+
+    print(" [+] Found {:d} nodes and {:d} links".format(len(M.flat.node_names),
+                                                        len(M.flat.link_ends)))
+
+    engine = Engine(M, t, verbose, EventQueue.make_queue(scheduler), seed, replication)
+
+    if link_events:
+        for event in M.check_link_events(link_events):
+            engine.schedule(event[0], EV_LINK, -1, event)
+
+    return engine
+
+
+def run_engine(engine, t, bar=False):
+    """ Runs the fast kernel 'engine' for 't' time units """
+
+    if bar:
+        print("\n [ Running progress bar ]")
+        engine.progress_bar = ProgressBar.setup(None, t)
+        print(" [ ", end="")
+        engine.schedule(engine.progress_bar.delta_t, EV_BAR, -1, None)
+
+    engine.run(t)
+
+
+class Node:
+    """ Node traces and counters, as consumed by TraceUtils """
+
+    def __init__(self, node_name, node_type):
+
+        self.name = node_name
+        self.type = node_type
+
+        # neighbour node name -> link transmission delay
+        self.conns = {}
+
+        # processing queue and queue length monitor (see QueueMonitor)
+        self.proc_queue = collections.deque()
+        self.queue_mon = QueueMonitor.QueueMonitor()
+
+        # packets persistent storage (columnar packet traces)
+        self.generated = TraceRecorder.TraceRecorder()
+        self.received = TraceRecorder.TraceRecorder()
+        self.forwarded = TraceRecorder.TraceRecorder()
+        self.discarded = TraceRecorder.TraceRecorder()
+
+        # counters for sent/received packets (key=node name)
+        self.pkt_sent = {}
+        self.pkt_recv = {}
+
+
+class Engine:
+    """
+        Standalone discrete event kernel running the round robin Node
+        semantics of the SimPy components on the event list 'events'
+        (see EventQueue). Per-node state is kept in flat lists indexed
+        by node ordinal.
+    """
+
+    def __init__(self, M, t, verbose=Globals.VERB_NO, events=None, seed=None, replication=0):
+
+        self.now = 0.0
+        self.sim_time = t
+        self.verbose = verbose
+        self.progress_bar = None
+
+        # event list of (time, seq, kind, node ordinal, data) tuples;
+        # 'seq' keeps events scheduled for the same time in FIFO order
+        if events is None:
+            events = EventQueue.HeapQueue()
+        self.events = events
+        self.seq = 0
+
+        # node ordinals, as in the model
+        self.names = M.node_names
+        self.index = M.node_index
+
+        # per-node parameters
+        self.pkt_rate = []
+        self.proc_delay = []
+        self.queue_check = []
+        self.quantum = []
+        self.nodes = []
+
+        F = M.flat
+
+        for i, node_name in enumerate(self.names):
+            node_type, pkt_rate, proc_delay, queue_check, _, quantum = F.node_param(i)
+            self.pkt_rate.append(pkt_rate)
+            self.proc_delay.append(proc_delay)
+            self.queue_check.append(queue_check)
+            if int(node_name) in Components.SERVER_NODES:
+                self.quantum.append(quantum)
+            else:
+                self.quantum.append(None)
+            self.nodes.append(Node(node_name, node_type))
+
+        # one random number stream per node, as in Simulator.create_network_model,
+        # and the samplers drawing from it
+        self.streams = RandomStreams.node_streams(seed, len(self.names))
+        self.draw_proc_delay = []
+        self.next_deltat = []
+        self.draw_pkt_type = []
+
+        for i, stream in enumerate(self.streams):
+            self.draw_proc_delay.append(stream.exponential(self.proc_delay[i]))
+            self.next_deltat.append(PacketGenerator.sampler(self.pkt_rate[i], stream))
+            self.draw_pkt_type.append(stream.choice(list(Components.PKT_TYPE_DEST.keys())))
+
+        # per-node packet ID allocators, as in Simulator.create_network_model
+        self.new_id = []
+        for i in range(len(self.names)):
+            self.new_id.append(PacketIds.IdAllocator(i, replication).new_id)
+
+        # per-node link delays (key=neighbour ordinal), from the adjacency of the flat model
+        self.link_delay = [{} for _ in self.names]
+        transm_delay = F.link_transm_delay.tolist()
+        indices = F.indices.tolist()
+        links = F.links.tolist()
+        indptr = F.indptr.tolist()
+
+        for i in range(len(self.names)):
+            node = self.nodes[i]
+            for k in range(indptr[i], indptr[i + 1]):
+                j = indices[k]
+                delay = transm_delay[links[k]]
+                self.link_delay[i][j] = delay
+                node.conns[self.names[j]] = delay
+                node.pkt_sent[self.names[j]] = 0
+                node.pkt_recv[self.names[j]] = 0
+
+        # shortest path routing by node ordinal (see Routing)
+        self.M = M
+        self.routing = M.routing
+
+        # (node ordinal, node ordinal) link directions that are down
+        self.down = set()
+
+        # processing queues and forwarding process state
+        self.queues = [node.proc_queue for node in self.nodes]
+        self.idle = [True] * len(self.names)
+        self.idle_since = [0.0] * len(self.names)
+
+        # the network, as returned by Simulator.setup_network
+        self.network = {}
+        for node in self.nodes:
+            self.network[node.name] = node
+
+        # start packet generators
+        for i, node_name in enumerate(self.names):
+            if int(node_name) in Components.USER_NODES:
+                self.schedule(self.next_deltat[i](), EV_GEN, i, None)
+
+    def schedule(self, time, kind, i, data):
+        """ Schedules event 'kind' for node 'i' at simulation time 'time' """
+
+        self.events.push((time, self.seq, kind, i, data))
+        self.seq += 1
+
+    def run(self, until):
+        """ Processes events until the simulation time 'until' """
+
+        events = self.events
+        pop = events.pop
+
+        while len(events) > 0:
+
+            event = pop()
+
+            # leave events at or after 'until' for a later run
+            if event[0] >= until:
+                events.push(event)
+                break
+
+            self.now, _, kind, i, data = event
+
+            if kind == EV_RECV:
+                self.recv_pkt(i, data[0], data[1])
+            elif kind == EV_SEND:
+                self.send_pkt(i, data)
+            elif kind == EV_WAKE:
+                self.forward(i)
+            elif kind == EV_GEN:
+                self.gen_pkt(i)
+            elif kind == EV_LINK:
+                self.set_link_state(data)
+            elif kind == EV_BAR:
+                self.progress_bar.show(self.now)
+                self.schedule(self.now + self.progress_bar.delta_t, EV_BAR, -1, None)
+
+        self.now = until
+
+    def set_link_state(self, event):
+        """ Takes a link down or brings it back up, as the link event 'event' says """
+
+        _, n1, n2, state = event
+        i = self.index[n1]
+        j = self.index[n2]
+
+        # reroute around the link, then switch both of its directions
+        if self.M.set_link_state(n1, n2, state):
+            self.down.discard((i, j))
+            self.down.discard((j, i))
+        else:
+            self.down.add((i, j))
+            self.down.add((j, i))
+
+    def notify(self, i):
+        """ Wakes up the forwarding process of node 'i' if it is waiting for packets """
+
+        if not self.idle[i]:
+            return
+
+        self.idle[i] = False
+
+        # resume on the next queue check instant, as the SimPy components do
+        wake_time = self.now
+        queue_check = self.queue_check[i]
+        if queue_check > 0:
+            idle_since = self.idle_since[i]
+            checks = max(1, math.ceil((self.now - idle_since) / queue_check))
+            wake_time = max(self.now, idle_since + checks * queue_check)
+
+        self.schedule(wake_time, EV_WAKE, i, None)
+
+    def recv_pkt(self, i, c, pkt):
+        """ Node 'i' receives the packet 'pkt' from node 'c' """
+
+        node = self.nodes[i]
+
+        # the link went down while the packet was on the wire: the sending node loses it
+        if self.down and (self.index[c], i) in self.down:
+            self.nodes[self.index[c]].discarded.record(self.now, pkt)
+            return
+
+        # increment the counter for this sending node
+        node.pkt_recv[c] += 1
+
+        # put the packet in the processing queue
+        self.queues[i].append(pkt)
+        node.queue_mon.update(self.now, len(self.queues[i]))
+        self.notify(i)
+
+        # report as per verbose level
+        if self.verbose >= Globals.VERB_LO:
+            Utils.report(self.now, node.name, pkt, self.queues[i], 'if_recv', self.verbose)
+
+    def forward(self, i):
+        """ Forwarding process of node 'i': serves the processing queue """
+
+        node = self.nodes[i]
+        queue = self.queues[i]
+
+        while len(queue) > 0:
+
+            # get the first packet from the queue
+            pkt = queue.pop()
+            node.queue_mon.update(self.now, len(queue))
+
+            # report as per verbose level
+            if self.verbose >= Globals.VERB_LO:
+                Utils.report(self.now, node.name, pkt, queue, 'forward_process_get', self.verbose)
+
+            # if the destination is some other node, process and forward it
+            if pkt.dest_node != node.name:
+                delay = self.draw_proc_delay[i]()
+                self.schedule(self.now + delay, EV_SEND, i, pkt)
+                return
+
+            # the destination is this node: serve one round robin quantum
+            quantum = self.quantum[i]
+            if pkt.cpu_burst_copy > quantum:
+                queue.appendleft(pkt)
+                node.queue_mon.update(self.now, len(queue))
+                pkt.no_rounds += 1
+                pkt.cpu_burst_copy -= quantum
+            else:
+                # set the destination arrival time of the packet
+                pkt.dest_time_stamp = self.now
+                pkt.no_rounds += 1
+
+                # packet terminates here - put it in the received queue
+                node.received.record(self.now, pkt)
+
+                # report as per verbose level
+                if self.verbose >= Globals.VERB_LO:
+                    Utils.report(self.now, node.name, pkt, queue, 'forward_process_sink', self.verbose)
+
+        # no packets left: wait for the next one
+        self.idle[i] = True
+        self.idle_since[i] = self.now
+
+    def send_pkt(self, i, pkt):
+        """ Node 'i' has processed the packet 'pkt': send it to the next-hop node """
+
+        node = self.nodes[i]
+
+        # increment the packet hop counter
+        pkt.no_hops += 1
+
+        # get next-hop node along a shortest path
+        j = self.routing.next_hop(i, self.index[pkt.dest_node], pkt.id)
+
+        # no path is left to the destination while links are down: drop the packet
+        if j < 0:
+            node.discarded.record(self.now, pkt)
+            self.forward(i)
+            return
+
+        hop_node = self.names[j]
+        pkt.hop_node = hop_node
+
+        # put the packet onto the wire to the next-hop node, unless the link is down
+        if self.down and (i, j) in self.down:
+            node.discarded.record(self.now, pkt)
+        else:
+            self.schedule(self.now + self.link_delay[i][j], EV_RECV, j, (node.name, pkt))
+
+        # count this packet as sent to 'hop_node' and register it as forwarded
+        node.pkt_sent[hop_node] += 1
+        node.forwarded.record(self.now, pkt)
+
+        # report as per verbose level
+        if self.verbose > Globals.VERB_NO:
+            Utils.report(self.now, node.name, pkt, self.queues[i], 'send_to_node', self.verbose)
+        if self.verbose >= Globals.VERB_LO:
+            Utils.report(self.now, node.name, pkt, self.queues[i], 'forward_process_fwd', self.verbose)
+
+        # carry on serving the processing queue
+        self.forward(i)
+
+    def gen_pkt(self, i):
+        """ Packet generator of node 'i' """
+
+        node = self.nodes[i]
+
+        # randomly find the packet type and the server it is scheduled on
+        pkt_type = self.draw_pkt_type[i]()
+        pkt = self.make_pkt(i, pkt_type, Components.PKT_TYPE_DEST[pkt_type], self.draw_proc_delay[i]())
+
+        # add the packet to the processing queue and the generated queue
+        self.queues[i].appendleft(pkt)
+        node.queue_mon.update(self.now, len(self.queues[i]))
+        node.generated.record(self.now, pkt)
+        self.notify(i)
+
+        if self.verbose >= Globals.VERB_LO:
+            Utils.report(self.now, node.name, pkt, self.queues[i], 'pkt_gen_process', self.verbose)
+
+        # schedule the arrival of the next packet
+        self.schedule(self.now + self.next_deltat[i](), EV_GEN, i, None)
+
+    def make_pkt(self, i, pkt_type, dest_node, cpu_burst):
+        """ Creates a network packet at node 'i' """
+
+        return Packet.Packet(self.now, self.new_id[i](), pkt_type, self.names[i], dest_node,
+                             cpu_burst=cpu_burst)
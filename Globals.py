@@ -5,9 +5,16 @@ VERSION = 0
 REVISION = 3
 SUBREV = 3
 
-# Queue monitoring interval
+# Queue monitoring interval (used to resample the queue monitors on export)
 QUEUE_MONITOR_DELTAT = 0.001
 
+# Number of random variates drawn at a time by the node random streams
+RNG_BLOCK_SIZE = 4096
+
+# Number of rows the packet trace recorders buffer before copying them
+# into their columns
+TRACE_BLOCK_SIZE = 4096
+
 # Network model keywords- model graph definition keywords
 MODEL_NAME_KWD = 'model_name'
 
@@ -24,6 +31,10 @@ NODE_QUEUE_CUTOFF_KWD = 'node_queue_cutoff'
 # The interval for checking the queue when not locked in processing
 NODE_QUEUE_CHECK_KWD = 'node_queue_check'
 
+# Round robin quantum of the servers (optional, NODE_QUANTUM if not given)
+NODE_QUANTUM_KWD = 'node_quantum'
+NODE_QUANTUM = 1
+
 # Link attribute keywords
 LINK_CAPACITY_KWD = 'link_capacity'  # link capacity
 
@@ -33,6 +44,57 @@ LINK_TRANSM_DELAY_KWD = 'link_transm_delay'
 # The table of shortest paths
 PATH_G_KWD = 'path_G'
 
+# Routing modes: the table of shortest paths between all nodes, computed
+# up front, or shortest path trees computed per destination on first use
+# and kept in a cache of at most ROUTING_CACHE_SIZE trees
+ROUTING_TABLE = 'table'
+ROUTING_LAZY = 'lazy'
+ROUTING_CACHE_SIZE = 1024
+
+# Hierarchical routing: tables of shortest paths within regions of the
+# graph, and of next hops towards every region; regions are the node
+# types or detected communities, split into connected components of at
+# most REGION_SIZE_FACTOR * sqrt(N) nodes
+ROUTING_HIERARCHICAL = 'hierarchical'
+REGIONS_TYPE = 'type'
+REGIONS_COMMUNITY = 'community'
+REGION_SIZE_FACTOR = 1
+
+# Routing metrics: shortest paths by hop count, or by the sum of the
+# link transmission delays
+ROUTING_METRIC_HOPS = 'hops'
+ROUTING_METRIC_DELAY = 'delay'
+
+# Relative tolerance within which two path lengths count as equal
+ROUTING_TOLERANCE = 1e-9
+
+# Link states of the scheduled link events (see Driver.run_sim)
+LINK_DOWN = 'down'
+LINK_UP = 'up'
+
+# Channel modes: one SimPy process per packet on the wire, or a FIFO
+# delay line drained by one process per link direction
+CHANNEL_PROCESS = 'process'
+CHANNEL_DELAY_LINE = 'delay_line'
+
+# Receive modes: one 'if_recv' process per connection, or channels that
+# deliver packets straight into the processing queue of the receiving node
+RECV_PROCESS = 'process'
+RECV_CALLBACK = 'callback'
+
+# Simulation engines: SimPy (reference), or the standalone event list kernel
+# (Round Robin component only, see FastSim)
+ENGINE_SIMPY = 'simpy'
+ENGINE_FAST = 'fast'
+
+# Confidence level of the confidence intervals over replications (see Driver.run_replications())
+CONFIDENCE_LEVEL = 0.95
+
+# Event list schedulers: binary heap, or calendar queue for very large
+# pending event sets
+SCHEDULER_HEAP = 'heap'
+SCHEDULER_CALENDAR = 'calendar'
+
 
 # Packet structure keywords
 TIME_STAMP = 'time_stamp'
@@ -53,6 +115,9 @@ SIZE_COPY = 'size_copy'
 SERVICE_TIME = 'service_time'
 NONE = 'none'
 
+# Packet trace column of the simulation time at which a packet was recorded
+STIME = 'stime'
+
 # Suffixes for input files
 TOPO_SUFFIX = ".topo"
 TYPE_SUFFIX = ".type"
@@ -61,6 +126,10 @@ PARAM_SUFFIX = ".param"
 # Suffix for pickling the model
 PICKLE_SUFFIX = ".pickle"
 
+# Suffix and format version of the compiled model cache (see ModelUtils.load_model())
+MODEL_CACHE_SUFFIX = ".npz"
+MODEL_CACHE_VERSION = 2
+
 # Suffixes for output files
 NODES_LIST_FILE = 'nodes.dat'
 GEN_SUFFIX = '_gen.csv'
@@ -69,6 +138,23 @@ DISCARD_SUFFIX = '_discard.csv'
 RECV_SUFFIX = '_recv.csv'
 QUEUE_SUFFIX = '_queue.csv'
 
+# Suffixes for binary output files
+GEN_BIN_SUFFIX = '_gen.trc'
+FWD_BIN_SUFFIX = '_fwd.trc'
+DISCARD_BIN_SUFFIX = '_discard.trc'
+RECV_BIN_SUFFIX = '_recv.trc'
+QUEUE_BIN_SUFFIX = '_queue.trc'
+
+# Trace file formats: text CSV, or binary columnar chunks (see TraceWriter),
+# one file per node and trace type, or all the traces of a run in a single
+# binary container file
+TRACE_FORMAT_CSV = 'csv'
+TRACE_FORMAT_BINARY = 'binary'
+TRACE_FORMAT_CONTAINER = 'container'
+
+# Binary trace container file of a run
+TRACE_CONTAINER_FILE = 'traces.trc'
+
 # Define verbose levels
 VERB_NO = 0
 VERB_LO = 1
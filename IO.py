@@ -3,32 +3,45 @@
 from . import Utils
 
 
-def open_for_reading(file_name):
+def open_for_reading(file_name, binary=False):
     """ Open file for reading """
 
     if not Utils.is_str(file_name):
         Utils.error("'{:s}' is not a string".format(file_name))
     try:
-        fp = open(file_name)
+        fp = open(file_name, "rb" if binary else "r")
     except IOError:
         Utils.error("'{:s}' does not exist".format(file_name))
 
     return fp
 
 
-def open_for_writing(file_name):
+def open_for_writing(file_name, binary=False):
     """ Open file for writing """
 
     if not Utils.is_str(file_name):
         Utils.error("'{:s}' is not a string".format(file_name))
     try:
-        fp = open(file_name, "w")
+        fp = open(file_name, "wb" if binary else "w")
     except IOError:
         Utils.error("Cannot open '{:s}' for writing".format(file_name))
 
     return fp
 
 
+def open_for_appending(file_name, binary=False):
+    """ Open file for appending """
+
+    if not Utils.is_str(file_name):
+        Utils.error("'{:s}' is not a string".format(file_name))
+    try:
+        fp = open(file_name, "ab" if binary else "a")
+    except IOError:
+        Utils.error("Cannot open '{:s}' for appending".format(file_name))
+
+    return fp
+
+
 def close_for_reading(fp):
     """ Close file opened for reading """
 
@@ -41,6 +54,23 @@ def close_for_writing(fp):
     fp.close()
 
 
+def iter_file_lines(file_name):
+    """
+        Iterates over the file lines, with the same filtering as file_lines(),
+        reading a line at a time instead of holding the whole file
+    """
+
+    fp = open_for_reading(file_name)
+
+    try:
+        for line in fp:
+            line = line.strip()
+            if line != "":
+                yield line
+    finally:
+        close_for_reading(fp)
+
+
 def file_lines(file_name):
     """ Return all file lines, with some filtering """
 
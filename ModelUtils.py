@@ -2,7 +2,11 @@
 
 import os
 import json
+import pickle
+import hashlib
+
 import networkx as nx
+import numpy as np
 
 from . import Globals
 from . import Utils
@@ -19,37 +23,35 @@ def links2graph(links):
     return G
 
 
-def load_links(model_name, input_dir="."):
-    """ Loads network links definition file, performs a few sanity checks, returns links """
+def load_links(model_name, input_dir=".", numeric=False):
+    """
+        Loads network links definition file, performs a few sanity checks, returns links.
+        The file is read a line at a time. With 'numeric', node names must
+        be plain decimal integers (as written by Utils.benchmark2anx()),
+        which are parsed and checked as integer arrays.
+    """
     """ This requires model TOPO file only """
 
     file_name = model_name + Globals.TOPO_SUFFIX
     file_path = os.path.join(input_dir, file_name)
-    lines = IO.file_lines(file_path)
-
-    links = []
-    for line in lines:
-        fields = line.split()
-        links.append([fields[0], fields[1]])
+    lines = IO.iter_file_lines(file_path)
 
     print(" [+] Verifying network topology..", end="")
 
-    # if any node is connected to itself trigger error
-    for edge in links:
-        if edge[0] == edge[1]:
-            print("{:s} - {:s}".format(edge[0], edge[1]))
-            Utils.error("Link connects node to itself")
-
-    # extract unique links
-    unique_links = []
-    for edge in links:
-        edge_flip = (edge[1], edge[0])
-        if (edge not in unique_links) and (edge_flip not
-                                           in unique_links):
-            unique_links.append(edge)
+    # extract unique links (a node connected to itself is an error)
+    if numeric:
+        edges = Utils.int_edges(lines)
+        n_links = len(edges)
+        unique = Utils.unique_int_edges(edges)
+        # node names are converted once per node, not once per link end
+        nodes, ends = np.unique(unique, return_inverse=True)
+        names = np.array([str(n) for n in nodes.tolist()], dtype=object)
+        unique_links = names[ends.reshape(-1, 2)].tolist()
+    else:
+        n_links, unique_links = Utils.unique_edges(line.split()[:2] for line in lines)
 
     print("All good")
-    print(" [+] Total number of links: {:d}".format(len(links)))
+    print(" [+] Total number of links: {:d}".format(n_links))
     print(" [+] Unique links: {:d}".format(len(unique_links)))
 
     return unique_links
@@ -84,22 +86,117 @@ def load_param(model_name, input_dir="."):
     return model_param
 
 
-def make_model(links, node_types, param, model_name):
-    """ Create a simulation model """
+def make_model(links, node_types, param, model_name, routing=Globals.ROUTING_TABLE,
+               cache_size=Globals.ROUTING_CACHE_SIZE, metric=Globals.ROUTING_METRIC_HOPS, ecmp=False,
+               regions=Globals.REGIONS_COMMUNITY):
+    """
+        Create a simulation model, with the routing mode 'routing' and the
+        routing metric 'metric' (see Globals), and equal-cost multipath
+        routing if 'ecmp' is set. Hierarchical routing partitions the model
+        into regions by 'regions' (see Routing.partition()).
+    """
 
     print(" [+] Preparing model")
 
-    M = Network.Model(model_name, links, node_types, param)
+    M = Network.Model(model_name, links, node_types, param, routing, cache_size, metric, ecmp,
+                      regions)
+
+    return M
+
+
+def model_key(model_name, input_dir=".", routing=Globals.ROUTING_TABLE,
+              cache_size=Globals.ROUTING_CACHE_SIZE, metric=Globals.ROUTING_METRIC_HOPS, ecmp=False,
+              regions=Globals.REGIONS_COMMUNITY, numeric=False):
+    """
+        Content hash of the model files (TOPO, TYPE, PARAM) of 'model_name',
+        of the routing options and of how node names are read ('numeric',
+        see load_links()), which keys the compiled model cache
+    """
+
+    h = hashlib.sha256()
+
+    for suffix in [Globals.TOPO_SUFFIX, Globals.TYPE_SUFFIX, Globals.PARAM_SUFFIX]:
+        fp = IO.open_for_reading(os.path.join(input_dir, model_name + suffix), binary=True)
+        h.update(hashlib.sha256(fp.read()).digest())
+        IO.close_for_reading(fp)
+
+    # the cache size only matters to lazy routing, whose routes are not cached
+    # numeric node names are canonical integers ('01' is node '1'), which changes the graph
+    options = [Globals.MODEL_CACHE_VERSION, routing, metric, bool(ecmp), bool(numeric)]
+    if routing == Globals.ROUTING_HIERARCHICAL:
+        options.append(regions)
+    h.update(json.dumps(options).encode())
+
+    return h.hexdigest()
+
+
+def load_model(model_name, input_dir=".", cache_dir=None, routing=Globals.ROUTING_TABLE,
+               cache_size=Globals.ROUTING_CACHE_SIZE, metric=Globals.ROUTING_METRIC_HOPS, ecmp=False,
+               regions=Globals.REGIONS_COMMUNITY, numeric=False):
+    """
+        Loads the model files of 'model_name' and creates the simulation
+        model (see make_model()). With a 'cache_dir', the compiled model
+        (graph attributes and routes, see Network.Model.compile()) is saved
+        there, keyed by the content hash of the model files (see model_key()),
+        and an unchanged model is loaded from the cache instead: no input
+        checks, graph building nor route computation. For 'numeric' see load_links().
+    """
+
+    cache_path = None
+    if cache_dir is not None:
+        key = model_key(model_name, input_dir, routing, cache_size, metric, ecmp, regions, numeric)
+        cache_path = os.path.join(cache_dir, model_name + "_" + key + Globals.MODEL_CACHE_SUFFIX)
+
+    if cache_path is not None and os.path.exists(cache_path):
+
+        print(" [+] Loading compiled model from cache")
+
+        with np.load(cache_path, allow_pickle=False) as data:
+            compiled = dict(data)
+
+        print(" [+] Preparing model")
+
+        M = Network.Model(model_name, None, None, None, routing, cache_size, metric, ecmp,
+                          regions, compiled)
+
+        return M
+
+    links = load_links(model_name, input_dir, numeric)
+    node_types = load_node_types(model_name, input_dir)
+    param = load_param(model_name, input_dir)
+
+    M = make_model(links, node_types, param, model_name, routing, cache_size, metric, ecmp, regions)
+
+    if cache_path is not None:
+        save_compiled(M.compile(links), cache_path)
 
     return M
 
 
+def save_compiled(compiled, cache_path):
+    """ Saves the compiled model 'compiled' to the cache file 'cache_path' """
+
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+
+    # write to a temporary file first, so that a cache file is always complete
+    tmp_path = cache_path + ".tmp"
+    fp = IO.open_for_writing(tmp_path, binary=True)
+    np.savez_compressed(fp, **compiled)
+    IO.close_for_writing(fp)
+    os.replace(tmp_path, cache_path)
+
+    print(" [+] Compiled model saved to cache")
+
+
 def pickle_model(G, model_name, output_dir="."):
     """ Stores model to a file with 'pickle' """
 
     model_file = model_name + Globals.PICKLE_SUFFIX
     model_path = os.path.join(output_dir, model_file)
-    nx.write_gpickle(G, model_path)
+
+    fp = IO.open_for_writing(model_path, binary=True)
+    pickle.dump(G, fp, protocol=pickle.HIGHEST_PROTOCOL)
+    IO.close_for_writing(fp)
 
     print(" [+] Model '{:s}' saved".format(model_name))
 
@@ -109,7 +206,9 @@ def unpickle_model(model_name, input_dir="."):
 
     model_file = model_name + Globals.PICKLE_SUFFIX
     model_path = os.path.join(input_dir, model_file)
-    G = nx.read_gpickle(model_path)
+    fp = IO.open_for_reading(model_path, binary=True)
+    G = pickle.load(fp)
+    IO.close_for_reading(fp)
 
     print(" [+] Model '{:s}' loaded".format(model_name))
 
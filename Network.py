@@ -1,32 +1,199 @@
 """ Network.py """
 
 import copy
+import json
+
 import networkx as nx
+import numpy as np
 
 from . import Globals
 from . import Utils
+from . import Routing
+
+
+# Prefix of the routing arrays in a compiled model (see Model.compile())
+ROUTING_PREFIX = 'routing_'
 
 
 class Model():
-    """ Models a network as a graph with parameters required for simulation """
+    """
+        Models a network as a graph with parameters required for simulation.
+        The model is a topology layer (graph structure, node ordinals, routes,
+        flat adjacency), which only depends on the links, and a parameter
+        overlay (node and link attributes, flat parameter vectors), which
+        with_param() replaces without rebuilding the topology layer.
+    """
 
-    def __init__(self, model_name, links, node_types, param):
+    def __init__(self, model_name, links, node_types, param, routing=Globals.ROUTING_TABLE,
+                 cache_size=Globals.ROUTING_CACHE_SIZE, metric=Globals.ROUTING_METRIC_HOPS, ecmp=False,
+                 regions=Globals.REGIONS_COMMUNITY, compiled=None):
 
         self.model_name = model_name
 
+        # a model compiled before (see compile()) needs no checks, and its routes are loaded
+        routing_state = None
+
+        if compiled is None:
+
+            # perform a few sanity checks
+            Utils.verify_input(links, node_types, param)
+
+            # create network graph
+            self.G = nx.Graph()
+            self.add_edges(links)  # creates nodes and links
+
+            # add network attributes
+            self.assign_node_attr(node_types, param)  # to nodes
+            self.assign_link_attr(param)  # to links
+
+        else:
+            self.G = self.load_compiled(compiled)
+            routing_state = {}
+            for key in compiled:
+                if key.startswith(ROUTING_PREFIX):
+                    routing_state[key[len(ROUTING_PREFIX):]] = compiled[key]
+
+        # node ordinals: node_names[i] is the node of ordinal i
+        self.node_names = list(self.G.nodes())
+        self.node_index = {}
+        for i, node_name in enumerate(self.node_names):
+            self.node_index[node_name] = i
+
+        # shortest path routing (next hop ordinals by node ordinals), see Routing
+        self.routing_options = (routing, cache_size, metric, ecmp, regions)
+        self.routing = Routing.make_routing(self.G, self.node_index, *self.routing_options,
+                                            state=routing_state)
+
+        # node and link parameters as flat arrays, for the simulators (see FlatModel)
+        self.flat = FlatModel(self)
+
+    def with_param(self, param):
+        """
+            Model of the same topology with the network parameters 'param'
+            (see ModelUtils.load_param()). Only the parameter overlay is
+            assigned anew: the graph structure, node ordinals, flat adjacency
+            and routes are shared with this model, unless the routes depend
+            on the link delays (delay metric) and these changed.
+        """
+
+        node_types = {}
+        for node_name in self.node_names:
+            node_types[node_name] = self.G.nodes[node_name][Globals.NODE_TYPE_KWD]
+
         # perform a few sanity checks
-        Utils.verify_input(links, node_types, param)
+        Utils.verify_input(self.G.edges(), node_types, param)
+
+        M = copy.copy(self)
+
+        # same nodes and links, with attribute dictionaries of their own, emptied
+        # so that no parameter of this model is left over if 'param' lacks it
+        M.G = self.G.copy()
+        for node_name in M.node_names:
+            M.G.nodes[node_name].clear()
+        for n1, n2 in M.G.edges():
+            M.G[n1][n2].clear()
+
+        M.assign_node_attr(node_types, param)
+        M.assign_link_attr(param)
+
+        M.flat = FlatModel(M, self.flat)
+
+        metric = self.routing_options[2]
+        if metric == Globals.ROUTING_METRIC_DELAY and \
+                not np.array_equal(M.flat.link_transm_delay, self.flat.link_transm_delay):
+            M.routing = Routing.make_routing(M.G, M.node_index, *M.routing_options)
+
+        return M
+
+    def compile(self, links):
+        """
+            The model as a dictionary of NumPy arrays (see ModelUtils.load_model()):
+            the nodes and their attributes, the links in the order 'links'
+            they were created in, their attributes, and the precomputed routes
+        """
+
+        # node attributes are the parameters of the node type
+        node_types = []
+        type_param = {}
+        for node_name in self.node_names:
+            node_type = self.G.nodes[node_name][Globals.NODE_TYPE_KWD]
+            node_types.append(node_type)
+            if node_type not in type_param:
+                type_param[node_type] = dict(self.G.nodes[node_name])
+                del type_param[node_type][Globals.NODE_TYPE_KWD]
+
+        meta = {"nodes": self.node_names, "types": node_types, "param": type_param}
+
+        edges = np.array([[self.node_index[n1], self.node_index[n2]] for n1, n2 in links],
+                         dtype=np.int32).reshape(-1, 2)
+
+        compiled = {"meta": np.array(json.dumps(meta)),
+                    "edges": edges,
+                    Globals.LINK_CAPACITY_KWD:
+                        np.array([self.G[n1][n2][Globals.LINK_CAPACITY_KWD] for n1, n2 in links]),
+                    Globals.LINK_TRANSM_DELAY_KWD:
+                        np.array([self.G[n1][n2][Globals.LINK_TRANSM_DELAY_KWD] for n1, n2 in links])}
+
+        routing_state = self.routing.state()
+        for key in routing_state:
+            compiled[ROUTING_PREFIX + key] = routing_state[key]
+
+        return compiled
+
+    def load_compiled(self, compiled):
+        """ Creates the model graph from the compiled model 'compiled' (see compile()) """
 
-        # create network graph
-        self.G = nx.Graph()
-        self.add_edges(links)  # creates nodes and links
+        meta = json.loads(str(compiled["meta"]))
+        node_names = meta["nodes"]
 
-        # add network attributes
-        self.assign_node_attr(node_types, param)  # to nodes
-        self.assign_link_attr(param)  # to links
+        G = nx.Graph()
 
-        # calculate the table of shortest paths
-        self.shortest_paths = Utils.shortest_path_table(self.G)
+        for node_name, node_type in zip(node_names, meta["types"]):
+            G.add_node(node_name, **meta["param"][node_type])
+            G.nodes[node_name][Globals.NODE_TYPE_KWD] = node_type
+
+        # the links in their original order, so that nodes list their neighbours as before
+        for (n1, n2), capacity, delay in zip(compiled["edges"].tolist(),
+                                             compiled[Globals.LINK_CAPACITY_KWD].tolist(),
+                                             compiled[Globals.LINK_TRANSM_DELAY_KWD].tolist()):
+            G.add_edge(node_names[n1], node_names[n2])
+            G[node_names[n1]][node_names[n2]][Globals.LINK_CAPACITY_KWD] = capacity
+            G[node_names[n1]][node_names[n2]][Globals.LINK_TRANSM_DELAY_KWD] = delay
+
+        return G
+
+    def check_link_events(self, link_events):
+        """
+            Verifies the link events 'link_events', (time, node 1, node 2, state)
+            tuples with the state Globals.LINK_DOWN or Globals.LINK_UP, and
+            returns them in time order
+        """
+
+        for t, n1, n2, state in link_events:
+            if not self.G.has_edge(n1, n2):
+                Utils.error("No link {:s}-{:s} for the link event at time {:f}".format(n1, n2, t))
+            if state not in [Globals.LINK_DOWN, Globals.LINK_UP]:
+                Utils.error("Unknown link state '{:s}'".format(state))
+
+        return sorted(link_events, key=lambda event: event[0])
+
+    def set_link_state(self, n1, n2, state):
+        """
+            Takes the link n1-n2 down or brings it back up (see check_link_events()),
+            and updates the routes around it. Returns whether the link is up.
+        """
+
+        if state == Globals.LINK_DOWN:
+            self.routing.link_down(self.node_index[n1], self.node_index[n2])
+        else:
+            self.routing.link_up(self.node_index[n1], self.node_index[n2])
+
+        return state == Globals.LINK_UP
+
+    def restore_links(self):
+        """ Brings all the links that are down back up """
+
+        self.routing.restore()
 
     def __str__(self):
         """ Returns the string that identifies the model """
@@ -36,16 +203,10 @@ class Model():
     def add_edges(self, links):
         """ Adds edges with attributes to the model graph """
 
-        # create a local copy of the list of links
-        links_local = copy.deepcopy(links)
-
-        # open space for link attributes
-        for edge in links_local:
-            edge.append({Globals.LINK_CAPACITY_KWD: None,
-                         Globals.LINK_TRANSM_DELAY_KWD: None})
-
-        # add edges with links to the model graph
-        self.G.add_edges_from(links_local)
+        # add edges with links to the model graph, with space for link attributes
+        # (every edge gets its own attribute dictionary; 'links' is left as it is)
+        self.G.add_edges_from(links, **{Globals.LINK_CAPACITY_KWD: None,
+                                        Globals.LINK_TRANSM_DELAY_KWD: None})
 
     def assign_node_attr(self, node_types, param):
         """ Assigns attributes to nodes """
@@ -84,3 +245,87 @@ class Model():
                 link_param[Globals.LINK_CAPACITY_KWD]
             self.G[n1][n2][Globals.LINK_TRANSM_DELAY_KWD] =\
                 link_param[Globals.LINK_TRANSM_DELAY_KWD]
+
+
+class FlatModel():
+    """
+        Flat representation of the model 'M': node parameters as vectors by
+        node ordinal (see Model), links by link ordinal, in the order of
+        M.G.edges(), and the adjacency in compressed sparse row form: the
+        node of ordinal i is linked to the nodes indices[indptr[i]:indptr[i + 1]]
+        by the links links[indptr[i]:indptr[i + 1]], in link order. The link
+        ends and the adjacency are shared with the flat model 'topology' of
+        a model of the same topology, if given (see Model.with_param()).
+    """
+
+    def __init__(self, M, topology=None):
+
+        self.node_names = M.node_names
+        self.node_index = M.node_index
+
+        # per-node parameters
+        self.node_type = []
+        self.pkt_rate = []  # packet generator distributions (see PacketGenerator)
+        proc_delay = []
+        queue_check = []
+        queue_cutoff = []
+        quantum = []
+
+        for node_name in self.node_names:
+            node_attr = M.G.nodes[node_name]
+            self.node_type.append(node_attr[Globals.NODE_TYPE_KWD])
+            self.pkt_rate.append(node_attr[Globals.NODE_PKT_RATE_KWD])
+            proc_delay.append(node_attr[Globals.NODE_PROC_DELAY_KWD])
+            queue_check.append(node_attr[Globals.NODE_QUEUE_CHECK_KWD])
+            queue_cutoff.append(node_attr[Globals.NODE_QUEUE_CUTOFF_KWD])
+            quantum.append(node_attr.get(Globals.NODE_QUANTUM_KWD, Globals.NODE_QUANTUM))
+
+        self.proc_delay = np.array(proc_delay, dtype=np.float64)
+        self.queue_check = np.array(queue_check, dtype=np.float64)
+        self.queue_cutoff = np.array(queue_cutoff, dtype=np.float64)
+        self.quantum = np.array(quantum, dtype=np.float64)
+
+        # per-link parameters, and the node ordinals at the two ends of each link
+        ends = []
+        capacity = []
+        transm_delay = []
+
+        for n1, n2, link_attr in M.G.edges(data=True):
+            if topology is None:
+                ends.append(self.node_index[n1])
+                ends.append(self.node_index[n2])
+            capacity.append(link_attr[Globals.LINK_CAPACITY_KWD])
+            transm_delay.append(link_attr[Globals.LINK_TRANSM_DELAY_KWD])
+
+        self.link_capacity = np.array(capacity, dtype=np.float64)
+        self.link_transm_delay = np.array(transm_delay, dtype=np.float64)
+
+        if topology is not None:
+            self.link_ends = topology.link_ends
+            self.indptr = topology.indptr
+            self.indices = topology.indices
+            self.links = topology.links
+            return
+
+        self.link_ends = np.array(ends, dtype=np.int32).reshape(-1, 2)
+
+        # adjacency: both directions of every link, grouped by node (stable, so in link order)
+        n_links = len(self.link_ends)
+        sources = np.concatenate([self.link_ends[:, 0], self.link_ends[:, 1]])
+        targets = np.concatenate([self.link_ends[:, 1], self.link_ends[:, 0]])
+        order = np.argsort(sources, kind='stable')
+
+        self.indptr = np.zeros(len(self.node_names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(self.node_names)), out=self.indptr[1:])
+        self.indices = targets[order]
+        self.links = np.concatenate([np.arange(n_links), np.arange(n_links)])[order].astype(np.int32)
+
+    def node_param(self, i):
+        """
+            Parameters of the node of ordinal i: its type, packet generator
+            distribution, processing delay, queue check interval, queue cutoff
+            and round robin quantum
+        """
+
+        return (self.node_type[i], self.pkt_rate[i], float(self.proc_delay[i]),
+                float(self.queue_check[i]), float(self.queue_cutoff[i]), float(self.quantum[i]))
@@ -0,0 +1,50 @@
+""" Packet.py """
+
+from . import Globals
+
+
+class Packet:
+    """
+        Network packet. The fields are named after the packet structure
+        keywords in Globals and stored in slots rather than a dict.
+    """
+
+    __slots__ = (Globals.TIME_STAMP, Globals.ID, Globals.TYPE, Globals.SOURCE,
+                 Globals.DEST_NODE, Globals.HOP_NODE, Globals.NO_HOPS, Globals.NO_ROUNDS,
+                 Globals.DEST_TIME_STAMP, Globals.CPU_BURST, Globals.CPU_BURST_COPY,
+                 Globals.SIZE, Globals.SIZE_COPY, Globals.SERVICE_TIME)
+
+    def __init__(self, time_stamp, pkt_id, pkt_type, source, dest_node, cpu_burst=0.0, size=1):
+
+        self.time_stamp = time_stamp
+        self.id = pkt_id
+        self.type = pkt_type
+        self.source = source
+        self.dest_node = dest_node
+        self.hop_node = Globals.NONE
+        self.no_hops = 0
+        self.no_rounds = 0
+        self.dest_time_stamp = -1.0
+        self.cpu_burst = cpu_burst
+        self.cpu_burst_copy = cpu_burst
+        self.size = size
+        self.size_copy = size
+        self.service_time = 0
+
+    def copy(self):
+        """ Returns a copy of the packet """
+
+        pkt = Packet.__new__(Packet)
+        for field in Packet.__slots__:
+            setattr(pkt, field, getattr(self, field))
+
+        return pkt
+
+    def as_dict(self):
+        """ Returns the packet as a dictionary keyed by the packet structure keywords """
+
+        pkt_dict = {}
+        for field in Packet.__slots__:
+            pkt_dict[field] = getattr(self, field)
+
+        return pkt_dict
@@ -2,6 +2,7 @@
 
 import random
 import math
+import itertools
 
 from . import Utils
 
@@ -21,3 +22,23 @@ def run(pkt_rate):
         Utils.error("Packet generator not implemented")
 
     return pkt_rate_deltat
+
+
+def sampler(pkt_rate, stream):
+    """
+        Returns a callable that gives the time to the next packet, as run()
+        does, drawing from the node random stream 'stream' (see RandomStreams)
+    """
+
+    gen_method = pkt_rate[0]
+
+    if gen_method == "poisson":
+        next_deltat = stream.exponential(pkt_rate[1])
+
+    elif gen_method == "periodic":
+        next_deltat = itertools.repeat(pkt_rate[1]).__next__
+
+    else:
+        Utils.error("Packet generator not implemented")
+
+    return next_deltat
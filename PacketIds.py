@@ -0,0 +1,123 @@
+""" PacketIds.py """
+
+import itertools
+
+import numpy as np
+
+from . import Utils
+
+
+# Bit layout of a 64-bit integer packet ID, from the most significant bits:
+# replication | source node ordinal | sequence number | thread number.
+# Thread number 0 is the packet (process) itself; fork-join threads of a
+# process share its ID apart from the thread number. Node ordinals,
+# replication and sequence numbers past their fields are errors.
+THREAD_BITS = 8
+SEQ_BITS = 28
+NODE_BITS = 20
+REPLICATION_BITS = 8
+
+THREAD_MASK = (1 << THREAD_BITS) - 1
+SEQ_MASK = (1 << SEQ_BITS) - 1
+NODE_MASK = (1 << NODE_BITS) - 1
+REPLICATION_MASK = (1 << REPLICATION_BITS) - 1
+
+# Multiplier (2^64 / golden ratio) and mask of the ID hash
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+HASH_MASK = (1 << 64) - 1
+
+
+class IdAllocator:
+    """ Monotonically increasing packet IDs in the namespace of a source node and a replication """
+
+    def __init__(self, node=0, replication=0):
+
+        if not 0 <= node <= NODE_MASK:
+            Utils.error("Node ordinal {:d} does not fit in a packet ID".format(node))
+        if not 0 <= replication <= REPLICATION_MASK:
+            Utils.error("Replication {:d} does not fit in a packet ID".format(replication))
+
+        self.node = node
+        self.replication = replication
+
+        base = ((replication << NODE_BITS) | node) << (SEQ_BITS + THREAD_BITS)
+
+        # new_id() returns the next ID; IDs step over the thread numbers, up to the
+        # last sequence number, after which new_id() stops the run (see overflow())
+        ids = range(base, base + ((SEQ_MASK + 1) << THREAD_BITS), 1 << THREAD_BITS)
+        self.new_id = itertools.chain(ids, self.overflow()).__next__
+
+    def overflow(self):
+        """ Generator that fails on the first ID past the last sequence number """
+
+        Utils.error("Node {:d} generated more than {:d} packets in replication {:d}"
+                    .format(self.node, SEQ_MASK + 1, self.replication))
+        yield
+
+
+def thread_id(pkt_id, thread_no):
+    """ ID of the thread 'thread_no' (1, 2, ...) of the packet 'pkt_id' """
+
+    return (pkt_id & ~THREAD_MASK) | thread_no
+
+
+def parent_id(pkt_id):
+    """ ID of the packet (process) that the packet or thread 'pkt_id' belongs to """
+
+    return pkt_id & ~THREAD_MASK
+
+
+def thread_no(pkt_id):
+    """ Thread number of 'pkt_id', 0 for the packet (process) itself """
+
+    return pkt_id & THREAD_MASK
+
+
+def sequence_no(pkt_id):
+    """ Sequence number of 'pkt_id' at its source node """
+
+    return (pkt_id >> THREAD_BITS) & SEQ_MASK
+
+
+def source_ordinal(pkt_id):
+    """ Ordinal of the source node of 'pkt_id' """
+
+    return (pkt_id >> (SEQ_BITS + THREAD_BITS)) & NODE_MASK
+
+
+def replication(pkt_id):
+    """ Replication that 'pkt_id' was generated in """
+
+    return pkt_id >> (NODE_BITS + SEQ_BITS + THREAD_BITS)
+
+
+def hash_id(pkt_id):
+    """
+        32-bit hash of 'pkt_id' (Fibonacci hashing), which spreads IDs that
+        differ in any bit field over the whole range
+    """
+
+    return ((pkt_id * HASH_MULTIPLIER) & HASH_MASK) >> 32
+
+
+def format_id(pkt_id):
+    """ Formats 'pkt_id' as a string 'replication-node-sequence-thread' """
+
+    return "{:d}-{:d}-{:d}-{:d}".format(replication(pkt_id), source_ordinal(pkt_id),
+                                        sequence_no(pkt_id), thread_no(pkt_id))
+
+
+def format_ids(pkt_ids):
+    """ Formats the NumPy array of IDs 'pkt_ids' as a list of strings, as format_id() """
+
+    pkt_ids = np.asarray(pkt_ids, dtype=np.uint64)
+
+    # split the bit fields with array operations, then format them together
+    fields = []
+    for shift, mask in [(NODE_BITS + SEQ_BITS + THREAD_BITS, REPLICATION_MASK),
+                        (SEQ_BITS + THREAD_BITS, NODE_MASK),
+                        (THREAD_BITS, SEQ_MASK),
+                        (0, THREAD_MASK)]:
+        fields.append(((pkt_ids >> np.uint64(shift)) & np.uint64(mask)).tolist())
+
+    return list(map("{:d}-{:d}-{:d}-{:d}".format, *fields))
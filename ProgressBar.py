@@ -31,11 +31,16 @@ class ProgressBar():
 
             yield self.env.timeout(self.delta_t)
 
-            percent = self.env.now/self.sim_time
-            hashes = '#' * int(round(percent * self.bar_length))
-            spaces = ' ' * (self.bar_length - len(hashes))
-            sys.stdout.write("\r [{0}] {1}%".format(hashes + spaces, int(round(percent*100))))
-            sys.stdout.flush()
+            self.show(self.env.now)
+
+    def show(self, now):
+        """ Redraw progress bar for the simulation time 'now' """
+
+        percent = now/self.sim_time
+        hashes = '#' * int(round(percent * self.bar_length))
+        spaces = ' ' * (self.bar_length - len(hashes))
+        sys.stdout.write("\r [{0}] {1}%".format(hashes + spaces, int(round(percent*100))))
+        sys.stdout.flush()
 
     def run(self):
         """ SimPy process to display progress bar """
@@ -0,0 +1,147 @@
+""" QueueMonitor.py """
+
+import array
+
+import numpy as np
+
+from . import Globals
+
+
+class QueueMonitor:
+    """
+        Change-point queue length monitor. The queue length is recorded
+        only when it changes, as run-length encoded (time, length) pairs;
+        several changes at the same instant keep the last one. The time
+        spent at each queue length is accumulated as the run goes, so the
+        time-weighted mean, maximum and percentiles need no pass over the
+        recorded pairs. Once streamed to a sink (see stream_to()), every
+        'block' change points are written out instead of kept.
+    """
+
+    def __init__(self, start=0.0, block=Globals.TRACE_BLOCK_SIZE):
+
+        self.start = start
+        self.block = block
+
+        # change points: queue length lengths[k] from times[k] on
+        self.times = array.array('d', [start])
+        self.lengths = array.array('q', [0])
+
+        # current queue length and the time up to which it has been accounted for
+        self.length = 0
+        self.since = start
+        self.max = 0
+
+        # total time spent at each queue length (index=queue length)
+        self.durations = [0.0]
+
+        # trace writer the change points are streamed to
+        self.sink = None
+
+    def __len__(self):
+
+        return len(self.times)
+
+    def __iter__(self):
+
+        return zip(self.times, self.lengths)
+
+    def update(self, now, length):
+        """ Records the queue length 'length' at simulation time 'now', if it has changed """
+
+        if length == self.length:
+            return
+
+        # account for the time spent at the previous length
+        self.durations[self.length] += now - self.since
+        self.since = now
+
+        self.length = length
+        if length > self.max:
+            self.max = length
+            self.durations.extend([0.0] * (length + 1 - len(self.durations)))
+
+        if self.times[-1] == now:
+            # another change at the same instant replaces the last change point
+            self.lengths[-1] = length
+            if len(self.lengths) > 1 and self.lengths[-2] == length:
+                self.times.pop()
+                self.lengths.pop()
+        else:
+            self.times.append(now)
+            self.lengths.append(length)
+
+            if self.sink is not None and len(self.times) > self.block:
+                self.flush()
+
+    def flush(self):
+        """ Writes all but the last change point to the sink """
+
+        # the last change point stays, as changes at the same instant replace it
+        self.sink.write_queue(self.times[:-1], self.lengths[:-1])
+        del self.times[:-1]
+        del self.lengths[:-1]
+
+    def stream_to(self, sink):
+        """
+            Writes the change points recorded so far, and from now on every
+            block of 'block' change points, to the trace writer 'sink' (see TraceWriter)
+        """
+
+        self.sink = sink
+        self.flush()
+
+    def close(self):
+        """ Writes the remaining change points to the sink, if any, and closes it """
+
+        if self.sink is not None:
+            self.sink.write_queue(self.times, self.lengths)
+            self.sink.close()
+            self.sink = None
+
+    def time_at_length(self, until=None):
+        """ NumPy array of the time spent at each queue length up to 'until' (default: the last change) """
+
+        durations = np.array(self.durations)
+        if until is not None and until > self.since:
+            durations[self.length] += until - self.since
+
+        return durations
+
+    def mean(self, until=None):
+        """ Time-weighted mean queue length up to 'until' (default: the last change) """
+
+        durations = self.time_at_length(until)
+        total = durations.sum()
+
+        if total <= 0:
+            return float(self.length)
+
+        return float(np.dot(np.arange(len(durations)), durations) / total)
+
+    def percentile(self, q, until=None):
+        """ Time-weighted 'q'-th percentile (0-100) of the queue length up to 'until' """
+
+        durations = self.time_at_length(until)
+        cum_durations = np.cumsum(durations)
+
+        if cum_durations[-1] <= 0:
+            return self.length
+
+        if q <= 0:
+            return int(np.flatnonzero(durations > 0)[0])
+
+        # smallest length the queue was at or below for a fraction q/100 of the time
+        return int(np.searchsorted(cum_durations, q / 100.0 * cum_durations[-1]))
+
+    def resample(self, deltat=Globals.QUEUE_MONITOR_DELTAT, until=None):
+        """ Queue length at the instants start, start + deltat, ... before 'until', as NumPy arrays """
+
+        if until is None:
+            until = self.since
+
+        grid = np.arange(self.start, until, deltat)
+        times = np.array(self.times, dtype=np.float64)
+        lengths = np.array(self.lengths, dtype=np.int64)
+
+        return grid, lengths[np.searchsorted(times, grid, side='right') - 1]
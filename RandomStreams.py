@@ -0,0 +1,73 @@
+""" RandomStreams.py """
+
+import functools
+
+import numpy as np
+
+from . import Globals
+
+
+def node_streams(seed, n):
+    """
+        Returns 'n' independent random streams, one per node, all derived
+        from 'seed'. With seed=None the streams are seeded from OS entropy.
+    """
+
+    seed_seq = np.random.SeedSequence(seed)
+
+    streams = []
+    for child in seed_seq.spawn(n):
+        streams.append(NodeStream(child))
+
+    return streams
+
+
+def block_draws(draw, block):
+    """ Generator of the variates returned by draw(block), drawn a block at a time """
+
+    while True:
+        yield from draw(block).tolist()
+
+
+class NodeStream:
+    """
+        Per-node random number stream. Each distribution (with its
+        parameters) gets a sampler: a callable that returns the next
+        variate from a NumPy draw buffer of 'block' variates, refilled
+        lazily. Samplers are meant to be fetched once and then called.
+    """
+
+    def __init__(self, seed=None, block=Globals.RNG_BLOCK_SIZE):
+
+        self.rng = np.random.default_rng(seed)
+        self.block = block
+        self.samplers = {}
+
+    def sampler(self, key, draw):
+        """ Returns the sampler 'key' of the variates returned by draw(size) """
+
+        if key not in self.samplers:
+            self.samplers[key] = functools.partial(next, block_draws(draw, self.block))
+
+        return self.samplers[key]
+
+    def exponential(self, rate):
+        """ Sampler of exponential variates with rate 'rate', as random.expovariate() """
+
+        return self.sampler(('exponential', rate),
+                            lambda size: self.rng.exponential(1.0 / rate, size))
+
+    def choice(self, options):
+        """ Sampler of uniformly chosen elements of 'options', as random.choice() """
+
+        values = np.empty(len(options), dtype=object)
+        values[:] = options
+
+        return self.sampler(('choice', tuple(options)),
+                            lambda size: values[self.rng.integers(0, len(values), size)])
+
+    def geometric(self, p):
+        """ Sampler of geometric variates (trials to first success), as np.random.geometric() """
+
+        return self.sampler(('geometric', p),
+                            lambda size: self.rng.geometric(p, size))
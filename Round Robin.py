@@ -1,34 +1,124 @@
 """ Components.py """
 
-import random
 import collections      # provides 'deque': double-ended queue
 import inspect
-import networkx as nx
+import math
 
 from . import Globals
 from . import Priority
 from . import Utils
 from . import PacketGenerator
+from . import RandomStreams
+from . import Packet
+from . import PacketIds
+from . import TraceRecorder
+from . import QueueMonitor
+
+
+# User nodes generate packets, server nodes process them round robin; the
+# fast kernel reproduces this component (see FastSim) and takes these from it
+FAST_ENGINE = True
+USER_NODES = range(1, 21)
+SERVER_NODES = range(25, 29)
+
+# Server (dest_node) on which each packet type is scheduled
+PKT_TYPE_DEST = {"Mail": "25", "Media": "26", "Storage": "27", "Navigation": "28"}
 
 
 class Channel:
     """ Model a connection between two nodes """
 
-    def __init__(self, env, delay, conn_out, conn_in):
+    def __init__(self, env, delay, conn_out, conn_in, mode=Globals.CHANNEL_DELAY_LINE):
         self.env = env
         self.delay = delay
         self.conn_out = conn_out
         self.conn_in = conn_in
+        self.mode = mode
+
+        # packets on the wire as [release_time, pkt]; the link delay is
+        # constant, so packets leave the wire in the order they entered it
+        self.delay_line = collections.deque()
+        self.wire_signal = None
+
+        # receive callback of the far-end node (see bind())
+        self.deliver = None
+
+        # whether the link is in service (see Simulator.link_events_process);
+        # packets put onto it or on the wire while it is down are lost and
+        # handed to the discard callback of the near-end node
+        self.up = True
+        self.discard = None
+
+        if self.mode == Globals.CHANNEL_DELAY_LINE:
+            self.env.process(self.drain())
+        elif self.mode != Globals.CHANNEL_PROCESS:
+            Utils.error("Channel mode '{:s}' not implemented".format(self.mode))
 
     def latency(self, pkt):
         """ Latency for putting packet onto the wire """
         yield self.env.timeout(self.delay)
 
-        self.conn_out.put(pkt)
+        self.release(pkt)
+
+    def drain(self):
+        """ Delay line process: releases packets once their latency has elapsed """
+
+        while True:
+
+            # if there are any packets on the wire
+            if len(self.delay_line) > 0:
+
+                release_time, pkt = self.delay_line[0]
+
+                # wait for the packet at the head of the line
+                if release_time > self.env.now:
+                    yield self.env.timeout(release_time - self.env.now)
+
+                self.delay_line.popleft()
+                self.release(pkt)
+
+            # sleep until a packet is put onto the wire
+            else:
+                self.wire_signal = self.env.event()
+                yield self.wire_signal
+                self.wire_signal = None
+
+    def bind(self, deliver):
+        """ Delivers packets leaving the wire straight to the callback 'deliver' """
+
+        self.deliver = deliver
+
+    def release(self, pkt):
+        """ Takes the packet 'pkt' off the wire, at the far end of the connection """
+
+        if not self.up:
+            self.lose(pkt)
+            return
+
+        if self.deliver is not None:
+            self.deliver(pkt)
+        else:
+            self.conn_out.put(pkt)
 
     def put(self, pkt):
         """ Puts the packet 'pkt' onto the wire """
-        self.env.process(self.latency(pkt))
+
+        if not self.up:
+            self.lose(pkt)
+            return
+
+        if self.mode == Globals.CHANNEL_DELAY_LINE:
+            self.delay_line.append([self.env.now + self.delay, pkt])
+            if self.wire_signal is not None and not self.wire_signal.triggered:
+                self.wire_signal.succeed()
+        else:
+            self.env.process(self.latency(pkt))
+
+    def lose(self, pkt):
+        """ Loses the packet 'pkt' on the link, which is down """
+
+        if self.discard is not None:
+            self.discard(pkt, "link down")
 
     def get(self):
         """ Retrieves packet from the connection """
@@ -38,42 +128,59 @@ class Channel:
 class Node:
     """ Model a network node """
 
-    def __init__(self, env, M, node_name, verbose):
+    def __init__(self, env, M, node_name, verbose, recv_mode=Globals.RECV_CALLBACK, stream=None,
+                 ids=None):
 
         self.env = env  # SimPy environment
         self.name = node_name  # must be unique
-        self.type = M.G.nodes[node_name][Globals.NODE_TYPE_KWD]
-        self.pkt_rate = M.G.nodes[node_name][Globals.NODE_PKT_RATE_KWD]
-        self.proc_delay = M.G.nodes[node_name][Globals.NODE_PROC_DELAY_KWD]
-        self.queue_check = M.G.nodes[node_name][Globals.NODE_QUEUE_CHECK_KWD]
-        self.queue_cutoff = M.G.nodes[node_name][Globals.NODE_QUEUE_CUTOFF_KWD]
+        self.ordinal = M.node_index[node_name]
 
-        # precomputed table of shortest paths
-        self.path_G = M.shortest_paths
-        self.nodes = nx.nodes(M.G)
+        # node parameters, from the flat model (see Network.FlatModel)
+        (self.type, self.pkt_rate, self.proc_delay, self.queue_check,
+         self.queue_cutoff, self.node_quantum) = M.flat.node_param(self.ordinal)
+
+        # shortest path routing by node ordinal (see Routing)
+        self.routing = M.routing
+        self.node_names = M.node_names
+        self.node_index = M.node_index
+        self.nodes = M.node_names
 
         self.conns = {}
         self.verbose = verbose
+        self.recv_mode = recv_mode
+
+        # random number stream of this node (see RandomStreams)
+        if stream is None:
+            stream = RandomStreams.NodeStream()
+        self.stream = stream
+
+        # packet ID allocator of this node (see PacketIds)
+        if ids is None:
+            ids = PacketIds.IdAllocator()
+        self.new_id = ids.new_id
 
-        # processing queue and queue length monitor
+        # sampler of the packet processing time (and CPU burst) of this node
+        self.draw_proc_delay = self.stream.exponential(self.proc_delay)
+
+        # processing queue and queue length monitor (see QueueMonitor)
         self.proc_queue = collections.deque()
-        self.queue_mon = collections.deque()
+        self.queue_mon = QueueMonitor.QueueMonitor(env.now)
 
-        # packets persistent storage
-        self.generated = collections.deque()
-        self.received = collections.deque()
-        self.forwarded = collections.deque()
-        self.discarded = collections.deque()
+        # packets persistent storage (columnar packet traces)
+        self.generated = TraceRecorder.TraceRecorder()
+        self.received = TraceRecorder.TraceRecorder()
+        self.forwarded = TraceRecorder.TraceRecorder()
+        self.discarded = TraceRecorder.TraceRecorder()
 
         # counters for sent/received packets (key=node name)
         self.pkt_sent = {}
         self.pkt_recv = {}
 
-        if int(self.name) in range(25, 29):
-            self.quantum = 1
+        if int(self.name) in SERVER_NODES:
+            self.quantum = self.node_quantum
 
-        # dt interval for incoming queue monitoring
-        self.queue_monitor_deltat = Globals.QUEUE_MONITOR_DELTAT
+        # event that wakes up the idle forwarding process (see notify())
+        self.queue_signal = None
 
     def add_conn(self, c, conn):
         """ Add a connection from this node to the node 'c' """
@@ -85,14 +192,18 @@ class Node:
     def if_up(self):
         """ Activates interfaces- this sets up SimPy processes """
 
-        # start receiving processes on all receiving connections
-        for c in self.conns:
-            self.env.process(self.if_recv(c))
+        # start receiving processes on all receiving connections, unless
+        # the connections deliver packets straight to recv_pkt()
+        if self.recv_mode == Globals.RECV_PROCESS:
+            for c in self.conns:
+                self.env.process(self.if_recv(c))
+        elif self.recv_mode != Globals.RECV_CALLBACK:
+            Utils.error("Receive mode '{:s}' not implemented".format(self.recv_mode))
 
-        # activate packet generator, packet forwarding, queue monitoring
+        # activate packet generator and packet forwarding; the queue monitor
+        # is updated whenever the processing queue changes
         self.env.process(self.pkt_gen_process())
         self.env.process(self.forward_process())
-        self.env.process(self.queue_monitor())
 
     def if_recv(self, c):
         """ Node receive interface from node 'c' """
@@ -105,15 +216,24 @@ class Node:
             # pick up any incoming packets
             pkt = yield conn.get()
 
-            # increment the counter for this sending node
-            self.pkt_recv[c] += 1
+            self.recv_pkt(c, pkt)
+
+    def recv_pkt(self, c, pkt):
+        """ Receives the packet 'pkt' from node 'c' """
+
+        # increment the counter for this sending node
+        self.pkt_recv[c] += 1
 
-            # put the packet in the processing queue
-            self.proc_queue.append(pkt)
+        # put the packet in the processing queue
+        self.proc_queue.append(pkt)
+        self.queue_mon.update(self.env.now, len(self.proc_queue))
 
-            # report as per verbose level
-            if self.verbose >= Globals.VERB_LO:
-                Utils.report(self.env.now, self.name, pkt, self.proc_queue, inspect.currentframe().f_code.co_name, self.verbose)
+        # wake up the forwarding process
+        self.notify()
+
+        # report as per verbose level
+        if self.verbose >= Globals.VERB_LO:
+            Utils.report(self.env.now, self.name, pkt, self.proc_queue, 'if_recv', self.verbose)
 
     def forward_process(self):
         """ Node packet forwarding process """
@@ -126,9 +246,10 @@ class Node:
 
                 # get the first packet from the queue
                 pkt = self.proc_queue.pop()
+                self.queue_mon.update(self.env.now, len(self.proc_queue))
 
                 # get the destination node
-                dest_node = pkt[Globals.DEST_NODE]
+                dest_node = pkt.dest_node
 
                 # report as per verbose level
                 if self.verbose >= Globals.VERB_LO:
@@ -144,17 +265,18 @@ class Node:
 
 
 
-                    if pkt[Globals.CPU_BURST_COPY] > self.quantum:
+                    if pkt.cpu_burst_copy > self.quantum:
                         self.proc_queue.appendleft(pkt)
-                        pkt[Globals.NO_ROUNDS] += 1
-                        pkt[Globals.CPU_BURST_COPY] -= self.quantum
+                        self.queue_mon.update(self.env.now, len(self.proc_queue))
+                        pkt.no_rounds += 1
+                        pkt.cpu_burst_copy -= self.quantum
                     else:
                         # set the destination arrival time of the packet
-                        pkt[Globals.DEST_TIME_STAMP] = self.env.now
-                        pkt[Globals.NO_ROUNDS] += 1
+                        pkt.dest_time_stamp = self.env.now
+                        pkt.no_rounds += 1
 
                         # packet terminates here - put it in the received queue
-                        self.received.append([self.env.now, pkt])
+                        self.received.record(self.env.now, pkt)
 
                         print(f'A packet has been successfully processed at server {self.name}')
 
@@ -170,16 +292,23 @@ class Node:
                     print(f'A packet has been scheduled on the server {dest_node}\n')
 
                     # incur packet processing time
-                    yield self.env.timeout(random.expovariate(self.proc_delay))  # no scheduling delay needed
+                    yield self.env.timeout(self.draw_proc_delay())  # no scheduling delay needed
 
                     # increment the packet hop counter
-                    pkt[Globals.NO_HOPS] += 1
+                    pkt.no_hops += 1
 
                     # get next-hop node along the shortest path
-                    hop_node = self.path_G[(self.name, dest_node)]
+                    hop = self.routing.next_hop(self.ordinal, self.node_index[dest_node], pkt.id)
+
+                    # no path is left to the destination while links are down: drop the packet
+                    if hop < 0:
+                        self.discard_packet(pkt, "no route to node " + dest_node)
+                        continue
+
+                    hop_node = self.node_names[hop]
 
                     # register the next-hop node with the packet
-                    pkt[Globals.HOP_NODE] = hop_node
+                    pkt.hop_node = hop_node
 
                     # forward packet to the next-hop node
                     self.send_to_node(pkt, hop_node)
@@ -188,7 +317,7 @@ class Node:
                     self.pkt_sent[hop_node] += 1
 
                     # register forwarded packets in the forward queue
-                    self.forwarded.append([self.env.now, pkt])
+                    self.forwarded.record(self.env.now, pkt)
 
                     # report as per verbose level
                     if self.verbose >= Globals.VERB_LO:
@@ -199,8 +328,26 @@ class Node:
             # if there are no packets in the processing queue
             else:
 
-                #  incur queue check delay
-                yield self.env.timeout(self.queue_check)
+                # sleep until a packet is put in the processing queue
+                idle_since = self.env.now
+                self.queue_signal = self.env.event()
+                yield self.queue_signal
+                self.queue_signal = None
+
+                # pick the packet up at the next queue check instant, i.e. at
+                # the same time as polling the queue every 'queue_check' would
+                if self.queue_check > 0:
+                    elapsed = self.env.now - idle_since
+                    checks = max(1, math.ceil(elapsed / self.queue_check))
+                    deltat = idle_since + checks * self.queue_check - self.env.now
+                    if deltat > 0:
+                        yield self.env.timeout(deltat)
+
+    def notify(self):
+        """ Wakes up the forwarding process if it is waiting for packets """
+
+        if self.queue_signal is not None and not self.queue_signal.triggered:
+            self.queue_signal.succeed()
 
     def send_to_node(self, pkt, next_node):
         """ Sends packet to the destination node """
@@ -217,37 +364,38 @@ class Node:
         """ Process that generates networks packets """
 
         # Determine list of user nodes 1 - 20
-        if int(self.name) in range(1, 21):
+        if int(self.name) in USER_NODES:
+
+            # samplers of the packet interarrival times and types
+            next_deltat = PacketGenerator.sampler(self.pkt_rate, self.stream)
+            draw_pkt_type = self.stream.choice(list(PKT_TYPE_DEST.keys()))
 
             while True:
 
                 # find the arrival time of packets
-                pkt_gen_deltat = PacketGenerator.run(self.pkt_rate)
+                pkt_gen_deltat = next_deltat()
 
                 # incur packet processing time
                 yield self.env.timeout(pkt_gen_deltat)
 
                 # Randomly find the packet types and save it in 'pkt_type'
-                pkt_type = random.choice(["Mail", "Media", "Storage", "Navigation"])
+                pkt_type = draw_pkt_type()
 
                 # Specify the server (dest_node) on which the packet should be scheduled and save it in 'dest_node'
-                if pkt_type == "Mail":
-                    dest_node = "25"
-                elif pkt_type == 'Media':
-                    dest_node = "26"
-                elif pkt_type == 'Storage':
-                    dest_node = "27"
-                elif pkt_type == 'Navigation':
-                    dest_node = "28"
+                dest_node = PKT_TYPE_DEST[pkt_type]
 
                 # Generate a packet
                 pkt = self.make_pkt(pkt_type, dest_node)
 
                 # Add the packet to the processing queue of the node
                 self.proc_queue.appendleft(pkt)
+                self.queue_mon.update(self.env.now, len(self.proc_queue))
 
                 # Report generated packets in the generated queue
-                self.generated.appendleft([self.env.now, pkt])
+                self.generated.record(self.env.now, pkt)
+
+                # wake up the forwarding process
+                self.notify()
 
                 if self.verbose >= Globals.VERB_LO:
                     Utils.report(self.env.now, self.name, pkt, self.proc_queue, inspect.currentframe().f_code.co_name, self.verbose)
@@ -255,33 +403,13 @@ class Node:
     def make_pkt(self, pkt_type, dest_node):
         """ Creates a network packet """
 
-        pkt = {
-            Globals.TIME_STAMP: self.env.now,
-            Globals.ID: Utils.gen_id(),
-            Globals.TYPE: pkt_type,
-            Globals.NO_ROUNDS: 0,
-            Globals.SOURCE: self.name,
-            Globals.DEST_NODE: dest_node,
-            Globals.HOP_NODE: Globals.NONE,
-            Globals.DEST_TIME_STAMP: -1.0,
-            Globals.NO_HOPS: 0,
-            Globals.CPU_BURST: random.expovariate(self.proc_delay)
-        }
-        pkt[Globals.CPU_BURST_COPY] = pkt[Globals.CPU_BURST]
+        pkt = Packet.Packet(self.env.now, self.new_id(), pkt_type, self.name, dest_node,
+                            cpu_burst=self.draw_proc_delay())
         return pkt
 
     def discard_packet(self, pkt, msg):
         """ Discards the packet (puts the packet into the node packet sink) """
 
         # place this packet in the node sink
-        self.discarded.append([self.env.now, pkt])
-
-    def queue_monitor(self):
-        """ Queue monitor process """
-
-        while True:
-            # add to queue monitor time now and queue_length
-            self.queue_mon.append([self.env.now, len(self.proc_queue)])
+        self.discarded.record(self.env.now, pkt)
 
-            # incur monitor queue delay  [queue_check = 0.001]
-            yield self.env.timeout(self.queue_monitor_deltat)
@@ -0,0 +1,822 @@
+""" Routing.py """
+
+import collections      # provides 'OrderedDict'
+import heapq
+
+import networkx as nx
+import numpy as np
+
+from . import Globals
+from . import Utils
+from . import PacketIds
+
+
+def make_routing(G, node_index, routing=Globals.ROUTING_TABLE, cache_size=Globals.ROUTING_CACHE_SIZE,
+                 metric=Globals.ROUTING_METRIC_HOPS, ecmp=False, regions=Globals.REGIONS_COMMUNITY,
+                 state=None):
+    """
+        Routing of the graph 'G', whose nodes have the ordinals 'node_index'
+        (name -> ordinal), in the routing mode 'routing', on shortest paths
+        by the metric 'metric' (see Globals). With 'ecmp', packets are spread
+        over all the equal-cost next hops. Hierarchical routing partitions
+        the graph into regions as 'regions' says (see partition()).
+        Precomputed routes are loaded from 'state' if given (see Routing.state()).
+    """
+
+    if state is not None and routing != Globals.ROUTING_LAZY:
+        print(" [*] Loading shortest paths")
+
+    if routing == Globals.ROUTING_TABLE:
+        if state is None:
+            print(" [*] Calculating shortest paths")
+        return TableRouting(G, node_index, metric, ecmp, state)
+    elif routing == Globals.ROUTING_LAZY:
+        return LazyRouting(G, node_index, cache_size, metric, ecmp)
+    elif routing == Globals.ROUTING_HIERARCHICAL:
+        if ecmp:
+            Utils.error("Equal-cost multipath is not implemented for hierarchical routing")
+        if state is None:
+            print(" [*] Calculating shortest paths within and between regions")
+        return HierarchicalRouting(G, node_index, regions, metric, state)
+
+    Utils.error("Routing mode '{:s}' not implemented".format(routing))
+
+
+class Routing:
+    """
+        Shortest path routing on node ordinals. The routes towards a
+        destination j make up the tree of j: the path lengths 'dist' to j
+        of all nodes, and their next hops 'hops', a NumPy array of the next
+        hop of every node, or with ECMP the sets of equal-cost next hops as
+        compressed sparse rows (ptr, hops): the next hops of node i are
+        hops[ptr[i]:ptr[i + 1]]. Subclasses decide which trees are kept.
+
+        Links can be taken down and brought back up (see link_down() and
+        link_up()); only the trees whose routes change are updated, and
+        within them only the nodes whose routes change.
+    """
+
+    def __init__(self, G, node_index, metric=Globals.ROUTING_METRIC_HOPS, ecmp=False):
+
+        if metric == Globals.ROUTING_METRIC_HOPS:
+            weight = None
+        elif metric == Globals.ROUTING_METRIC_DELAY:
+            weight = Globals.LINK_TRANSM_DELAY_KWD
+        else:
+            Utils.error("Routing metric '{:s}' not implemented".format(metric))
+
+        self.metric = metric
+        self.ecmp = ecmp
+
+        self.indptr, self.indices, self.weights = Utils.adjacency_arrays(G, node_index, weight)
+        if np.any(self.weights <= 0):
+            Utils.error("Link lengths must be positive to route by '{:s}'".format(metric))
+
+        # links in service (both directions of a link are taken down together)
+        self.active = np.ones(len(self.indices), dtype=bool)
+        self.down = set()
+
+        # links in service of every node as (neighbour, length) pairs, for Dijkstra's algorithm
+        self.links = [self.node_links(i) for i in range(len(node_index))]
+
+        # number of trees updated after link changes
+        self.repaired = 0
+
+    def node_links(self, i):
+        """ Links in service of node i, as (neighbour, length) pairs """
+
+        lo, hi = self.indptr[i], self.indptr[i + 1]
+        on = self.active[lo:hi]
+
+        return list(zip(self.indices[lo:hi][on].tolist(), self.weights[lo:hi][on].tolist()))
+
+    def relax(self, dist, heap):
+        """
+            Dijkstra's algorithm from the (length, node) pairs 'heap', lowering
+            the path lengths 'dist' in place. Returns the nodes it settled.
+        """
+
+        settled = []
+
+        while heap:
+            d, v = heapq.heappop(heap)
+            if d > dist[v]:
+                continue
+            settled.append(v)
+            for u, w in self.links[v]:
+                if d + w < dist[u]:
+                    dist[u] = d + w
+                    heapq.heappush(heap, (d + w, u))
+
+        return settled
+
+    def distances(self, j):
+        """
+            NumPy array of the shortest path length from every node to node j,
+            or to the nearest of the nodes in the array j
+        """
+
+        if self.metric == Globals.ROUTING_METRIC_HOPS:
+            return Utils.bfs_distances(self.indptr, self.indices, j, self.active)
+
+        dist = [np.inf] * len(self.links)
+        heap = []
+        for v in np.atleast_1d(j).tolist():
+            dist[v] = 0.0
+            heap.append((0.0, v))
+
+        self.relax(dist, heap)
+
+        return np.array(dist)
+
+    def next_hops(self, dist, j):
+        """ Next hops towards node j (see above), given the path lengths 'dist' to it """
+
+        if not self.ecmp:
+            return Utils.next_hop_tree(self.indptr, self.indices, self.weights, dist, j, self.active)
+
+        links, sources = Utils.on_path_links(self.indptr, self.indices, self.weights, dist,
+                                             active=self.active)
+        ptr = np.searchsorted(sources, np.arange(len(self.links) + 1))
+
+        return ptr, self.indices[links].astype(np.int32)
+
+    def compute_tree(self, j):
+        """ Tree (dist, hops) of node j """
+
+        dist = self.distances(j)
+
+        return dist, self.next_hops(dist, j)
+
+    def tree(self, j):
+        """ Next hops towards node j, as kept by the subclass """
+
+        raise NotImplementedError
+
+    def kept(self):
+        """ Ordinals of the destinations whose trees are kept """
+
+        raise NotImplementedError
+
+    def get(self, j):
+        """ Kept tree (dist, hops) of node j """
+
+        raise NotImplementedError
+
+    def put(self, j, dist, hops):
+        """ Replaces the kept tree of node j """
+
+        raise NotImplementedError
+
+    def kept_hops(self, j):
+        """ Next hops of the kept tree of node j, without computing its path lengths """
+
+        return self.get(j)[1]
+
+    def changed(self):
+        """
+            Ordinals of the kept destinations whose trees may differ from those
+            of the graph with all its links in service (see link_up())
+        """
+
+        return self.kept()
+
+    def state(self):
+        """
+            Precomputed routes as a dictionary of NumPy arrays, from which the
+            subclass can be set up again without computing them (see make_routing())
+        """
+
+        return {}
+
+    def next_hop(self, i, j, pkt_id=0):
+        """
+            Ordinal of the next hop node on a shortest path from node i -> node j
+            (j if i == j, -1 if there is no path). With ECMP, one of the
+            equal-cost next hops is picked by a hash of the packet ID 'pkt_id'.
+        """
+
+        hops = self.tree(j)
+
+        if not self.ecmp:
+            return int(hops[i])
+
+        ptr, hops = hops
+        lo = ptr[i]
+        n = ptr[i + 1] - lo
+
+        if n == 0:
+            return j if i == j else -1
+        elif n == 1:
+            return int(hops[lo])
+
+        return int(hops[lo + PacketIds.hash_id(pkt_id) % n])
+
+    def has_hop(self, hops, i, k):
+        """ Whether k is a next hop of node i in the next hops 'hops' """
+
+        if not self.ecmp:
+            return hops[i] == k
+
+        ptr, hops = hops
+
+        return k in hops[ptr[i]:ptr[i + 1]]
+
+    def set_link(self, i, k, up):
+        """ Puts the link between nodes i and k in or out of service """
+
+        for a, b in [(i, k), (k, i)]:
+            lo, hi = self.indptr[a], self.indptr[a + 1]
+            positions = lo + np.flatnonzero(self.indices[lo:hi] == b)
+            if len(positions) == 0:
+                Utils.error("No link between nodes {:d} and {:d}".format(i, k))
+            self.active[positions] = up
+
+        self.links[i] = self.node_links(i)
+        self.links[k] = self.node_links(k)
+
+        if up:
+            self.down.discard((min(i, k), max(i, k)))
+        else:
+            self.down.add((min(i, k), max(i, k)))
+
+    def link_length(self, i, k):
+        """ Length of the link between nodes i and k """
+
+        lo, hi = self.indptr[i], self.indptr[i + 1]
+
+        return float(self.weights[lo + np.flatnonzero(self.indices[lo:hi] == k)[0]])
+
+    def update_hops(self, dist, j, hops, nodes):
+        """ Next hops towards node j after the path lengths 'dist' of the nodes 'nodes' changed """
+
+        if self.ecmp:
+            return self.next_hops(dist, j)
+
+        # the destinations keep themselves as next hops
+        nodes = np.asarray(nodes, dtype=np.int64)
+        nodes = nodes[dist[nodes] > 0]
+        hops[nodes] = -1
+
+        links, sources = Utils.on_path_links(self.indptr, self.indices, self.weights, dist,
+                                             nodes, self.active)
+        sources, first = np.unique(sources, return_index=True)
+        hops[sources] = self.indices[links[first]]
+
+        return hops
+
+    def upstream(self, dist, k):
+        """ Nodes with a shortest path through node k (k included), by the path lengths 'dist' """
+
+        found = np.zeros(len(self.links), dtype=bool)
+        found[k] = True
+        frontier = np.array([k], dtype=np.int64)
+
+        while len(frontier) > 0:
+
+            # the nodes whose shortest paths can take a link to the frontier
+            positions, near = Utils.link_positions(self.indptr, frontier)
+            on = self.active[positions]
+            positions = positions[on]
+            near = near[on]
+            far = self.indices[positions]
+
+            # the link far -> near is as long as near -> far
+            on_path = (self.weights[positions] + dist[near] <= dist[far] * (1 + Globals.ROUTING_TOLERANCE))
+            on_path &= dist[near] < dist[far]
+
+            frontier = np.unique(far[on_path & ~found[far]])
+            found[frontier] = True
+
+        return np.flatnonzero(found)
+
+    def repair_down(self, dist, k):
+        """
+            Updates in place the path lengths 'dist' after the first link of
+            a shortest path from node k went out of service. Returns the
+            nodes whose path lengths were recomputed.
+        """
+
+        # only the nodes with a shortest path through k can have longer paths now
+        affected = self.upstream(dist, k)
+        dist[affected] = np.inf
+
+        # restart their paths from their unaffected neighbours
+        heap = []
+        for v in affected.tolist():
+            for u, w in self.links[v]:
+                if dist[u] + w < dist[v]:
+                    dist[v] = dist[u] + w
+            if dist[v] < np.inf:
+                heap.append((dist[v], v))
+
+        heapq.heapify(heap)
+        self.relax(dist, heap)
+
+        return affected
+
+    def repair_up(self, dist, i, k, w):
+        """
+            Updates in place the path lengths 'dist' after the link between
+            nodes i and k, of length 'w', came into service. Returns the nodes
+            whose next hops may have changed, None if the tree is unaffected.
+        """
+
+        for a, b in [(i, k), (k, i)]:
+
+            if dist[a] == np.inf:
+                continue
+
+            if dist[a] + w < dist[b] * (1 - Globals.ROUTING_TOLERANCE):
+                # b and the nodes behind it get shorter paths through the link
+                dist[b] = dist[a] + w
+                changed = np.array(self.relax(dist, [(dist[b], b)]), dtype=np.int64)
+
+                # ... which their neighbours may take as equal-cost paths
+                positions, _ = Utils.link_positions(self.indptr, changed)
+
+                return np.union1d(changed, self.indices[positions])
+
+            if dist[a] + w <= dist[b] * (1 + Globals.ROUTING_TOLERANCE):
+                # the link is a new equal-cost next hop of b
+                return np.array([b], dtype=np.int64)
+
+        return None
+
+    def link_down(self, i, k):
+        """ Takes the link between nodes i and k out of service, and updates the routes """
+
+        if (min(i, k), max(i, k)) in self.down:
+            return
+
+        # the kept trees that take the link, before it goes (only their path
+        # lengths are computed, if they are computed on demand)
+        trees = []
+        for j in list(self.kept()):
+            hops = self.kept_hops(j)
+            if self.has_hop(hops, i, k):
+                trees.append((j, i))
+            elif self.has_hop(hops, k, i):
+                trees.append((j, k))
+
+        trees = [(j, start) + tuple(self.get(j)) for j, start in trees]
+
+        self.set_link(i, k, False)
+
+        for j, start, dist, hops in trees:
+
+            nodes = self.repair_down(dist, start)
+            self.put(j, dist, self.update_hops(dist, j, hops, nodes))
+            self.repaired += 1
+
+    def link_up(self, i, k):
+        """ Brings the link between nodes i and k back into service, and updates the routes """
+
+        if (min(i, k), max(i, k)) not in self.down:
+            return
+
+        # a tree that no link going down changed is that of the graph with all its
+        # links in service, which the link cannot shorten: only the others are updated
+        trees = [(j,) + tuple(self.get(j)) for j in list(self.changed())]
+
+        self.set_link(i, k, True)
+        w = self.link_length(i, k)
+
+        for j, dist, hops in trees:
+
+            nodes = self.repair_up(dist, i, k, w)
+            if nodes is None:
+                continue
+
+            self.put(j, dist, self.update_hops(dist, j, hops, nodes))
+            self.repaired += 1
+
+    def restore(self):
+        """ Brings all the links back into service """
+
+        for i, k in sorted(self.down):
+            self.link_up(i, k)
+
+
+class TableRouting(Routing):
+    """
+        Precomputed routing: the trees of all the nodes, computed up front
+        or loaded from 'state' (see state()); without ECMP, the table of next
+        hops between all nodes. Takes N^2 time and memory up front.
+    """
+
+    def __init__(self, G, node_index, metric=Globals.ROUTING_METRIC_HOPS, ecmp=False, state=None):
+
+        super().__init__(G, node_index, metric, ecmp)
+
+        if state is not None:
+            self.load_state(state)
+            return
+
+        # next hops towards node j (the column j of the table without ECMP); path lengths
+        # are only needed to update the routes (see get()), and not kept until then
+        self.dist = [None] * len(node_index)
+        self.hops = []
+        for j in range(len(node_index)):
+            _, hops = self.compute_tree(j)
+            self.hops.append(hops)
+
+        if not self.ecmp:
+            # row j holds the next hops towards node j, the table is its transpose
+            self.table = np.ascontiguousarray(np.array(self.hops).T)
+            self.hops = None
+
+    def state(self):
+        """ The next hops as NumPy arrays; with ECMP, those of all the nodes concatenated """
+
+        if not self.ecmp:
+            return {"table": self.table}
+
+        return {"ptr": np.array([ptr for ptr, _ in self.hops]),
+                "hops": np.concatenate([hops for _, hops in self.hops]),
+                "hops_start": np.cumsum([0] + [len(hops) for _, hops in self.hops])}
+
+    def load_state(self, state):
+        """ Sets the next hops up from 'state' (see state()) """
+
+        # path lengths are only needed to update the routes, and computed then
+        self.dist = [None] * (len(self.indptr) - 1)
+
+        if not self.ecmp:
+            self.table = np.ascontiguousarray(state["table"], dtype=np.int32)
+            self.hops = None
+            return
+
+        self.hops = []
+        for j, ptr in enumerate(state["ptr"]):
+            lo, hi = state["hops_start"][j], state["hops_start"][j + 1]
+            self.hops.append((ptr, state["hops"][lo:hi]))
+
+    def tree(self, j):
+        """ Next hops towards node j """
+
+        if not self.ecmp:
+            return self.table[:, j]
+
+        return self.hops[j]
+
+    def kept(self):
+        """ All the destinations """
+
+        return range(len(self.dist))
+
+    def kept_hops(self, j):
+        """ Next hops towards node j """
+
+        return self.tree(j)
+
+    def changed(self):
+        """ The destinations whose path lengths were computed, to update their trees """
+
+        return [j for j, dist in enumerate(self.dist) if dist is not None]
+
+    def get(self, j):
+        """ Tree (dist, hops) of node j; path lengths are computed the first time """
+
+        if self.dist[j] is None:
+            self.dist[j] = self.distances(j)
+
+        return self.dist[j], self.tree(j)
+
+    def put(self, j, dist, hops):
+        """ Replaces the tree of node j """
+
+        self.dist[j] = dist
+        if not self.ecmp:
+            self.table[:, j] = hops
+        else:
+            self.hops[j] = hops
+
+    def next_hop(self, i, j, pkt_id=0):
+        """ Ordinal of the next hop node on a shortest path from node i -> node j (see Routing) """
+
+        if not self.ecmp:
+            return int(self.table[i, j])
+
+        return super().next_hop(i, j, pkt_id)
+
+
+class LazyRouting(Routing):
+    """
+        On-demand routing: the tree of a destination is computed the first
+        time a packet is routed to it, and kept in a cache of the 'cache_size'
+        most recently used trees. Setup cost and memory scale with the
+        number of destinations in use.
+    """
+
+    def __init__(self, G, node_index, cache_size=Globals.ROUTING_CACHE_SIZE,
+                 metric=Globals.ROUTING_METRIC_HOPS, ecmp=False):
+
+        if cache_size < 1:
+            Utils.error("Routing cache size must be at least 1")
+
+        super().__init__(G, node_index, metric, ecmp)
+
+        self.cache_size = cache_size
+
+        # destination ordinal -> tree (dist, hops), least recently used first
+        self.trees = collections.OrderedDict()
+
+        # number of trees computed (more than the destinations used if the cache is too small)
+        self.computed = 0
+
+    def tree(self, j):
+        """ Next hops towards node j, computed if not cached """
+
+        tree = self.trees.get(j)
+
+        if tree is None:
+            tree = self.compute_tree(j)
+            self.computed += 1
+            self.trees[j] = tree
+            if len(self.trees) > self.cache_size:
+                self.trees.popitem(last=False)
+        else:
+            self.trees.move_to_end(j)
+
+        return tree[1]
+
+    def kept(self):
+        """ The cached destinations """
+
+        return self.trees.keys()
+
+    def get(self, j):
+        """ Cached tree (dist, hops) of node j """
+
+        return self.trees[j]
+
+    def put(self, j, dist, hops):
+        """ Replaces the cached tree of node j, keeping its place in the cache """
+
+        self.trees[j] = (dist, hops)
+
+
+def partition(G, node_index, regions=Globals.REGIONS_COMMUNITY):
+    """
+        Partitions the graph 'G' into connected regions: the nodes of each
+        node type, or the communities found by Louvain community detection,
+        split into their connected components, and regions of more than
+        about sqrt(N) nodes split further (see split_region()). Returns the
+        lists of node names of the regions, ordered by their first node ordinal.
+    """
+
+    if regions == Globals.REGIONS_TYPE:
+        groups = {}
+        for node_name in node_index:
+            groups.setdefault(G.nodes[node_name][Globals.NODE_TYPE_KWD], []).append(node_name)
+        groups = list(groups.values())
+    elif regions == Globals.REGIONS_COMMUNITY:
+        groups = nx.community.louvain_communities(G, seed=0)
+    else:
+        Utils.error("Region partitioning '{:s}' not implemented".format(regions))
+
+    max_size = max(1, int(Globals.REGION_SIZE_FACTOR * np.sqrt(len(node_index))))
+
+    parts = []
+    for group in groups:
+        parts.extend(split_region(G, group, max_size))
+
+    parts = [sorted(part, key=node_index.get) for part in parts]
+    parts.sort(key=lambda part: node_index[part[0]])
+
+    return parts
+
+
+def split_region(G, group, max_size):
+    """
+        Splits the nodes 'group' of the graph 'G' into connected regions of
+        at most 'max_size' nodes: its connected components, split again by
+        community detection within them while they are too large (or, if
+        no communities are found, into the first half of the nodes reached
+        by a breadth-first search and the rest). Returns the list of regions.
+    """
+
+    parts = []
+    pending = [set(component) for component in nx.connected_components(G.subgraph(group))]
+
+    while pending:
+
+        part = pending.pop()
+        if len(part) <= max_size:
+            parts.append(part)
+            continue
+
+        subgraph = G.subgraph(part)
+        groups = nx.community.louvain_communities(subgraph, seed=0)
+        if len(groups) < 2:
+            # a prefix of a breadth-first search order is connected
+            order = [node_name for node_name, _ in
+                     zip(nx.bfs_tree(subgraph, min(part)), range(len(part) // 2))]
+            groups = [set(order), part.difference(order)]
+
+        for group in groups:
+            pending.extend(set(component) for component in nx.connected_components(G.subgraph(group)))
+
+    return parts
+
+
+class HierarchicalRouting(Routing):
+    """
+        Two-level routing for large graphs: the graph is partitioned into
+        connected regions (see partition()). Within a region, packets follow
+        the table of shortest paths of the region (see TableRouting), which
+        stays inside it. Towards another region, they follow the border
+        table: the next hop of every node on a shortest path to the nearest
+        node of every region. The trees of this class are those of the
+        regions as a whole, whose path lengths are only computed to update
+        the routes. With about sqrt(N) regions of at most about sqrt(N)
+        nodes, both tables take O(N * sqrt(N)) memory. Routes within a
+        region never leave it; when links going down cut the nodes of a
+        region off from each other, the nodes of the region that others
+        of it cannot reach are routed to on shortest paths over the whole
+        graph, computed on demand (see detour()).
+    """
+
+    def __init__(self, G, node_index, regions=Globals.REGIONS_COMMUNITY,
+                 metric=Globals.ROUTING_METRIC_HOPS, state=None):
+
+        super().__init__(G, node_index, metric)
+
+        if state is None:
+            parts = partition(G, node_index, regions)
+        else:
+            # the regions, each in node ordinal order, ordered by their first node
+            node_names = list(node_index)
+            order = np.argsort(state["region"], kind="stable")
+            bounds = np.cumsum(np.bincount(state["region"]))[:-1]
+            parts = [[node_names[v] for v in members.tolist()] for members in np.split(order, bounds)]
+            tables_start = np.cumsum([0] + [len(part) ** 2 for part in parts])
+
+        # region and ordinal within the region of every node
+        self.members = []
+        self.tables = []
+        self.region = [0] * len(node_index)
+        self.local = [0] * len(node_index)
+
+        for r, part in enumerate(parts):
+
+            local_index = {}
+            for k, node_name in enumerate(part):
+                local_index[node_name] = k
+                self.region[node_index[node_name]] = r
+                self.local[node_index[node_name]] = k
+
+            # the table of shortest paths within the region, on local ordinals
+            table_state = None
+            if state is not None:
+                table_state = {"table": state["tables"][tables_start[r]:tables_start[r + 1]]
+                               .reshape(len(part), len(part))}
+            self.members.append(np.array([node_index[node_name] for node_name in part], dtype=np.int32))
+            self.tables.append(TableRouting(G.subgraph(part), local_index, metric, state=table_state))
+
+        print(" [*] {:d} regions of up to {:d} nodes".format(
+            len(self.members), max(len(members) for members in self.members)))
+
+        # path lengths to every region are only needed to update the routes (see get())
+        self.dist = [None] * len(self.members)
+
+        # nodes cut off within their region by links going down, and the next hops
+        # towards those of them in use, over the whole graph (see detour())
+        self.cut = set()
+        self.detours = {}
+
+        if state is not None:
+            self.border = np.ascontiguousarray(state["border"], dtype=np.int32)
+            return
+
+        # the next hops towards every region
+        hops = []
+        for r in range(len(self.members)):
+            _, tree = self.compute_tree(r)
+            hops.append(tree)
+
+        # row r holds the next hops towards region r, the table is its transpose
+        self.border = np.ascontiguousarray(np.array(hops).T)
+
+    def compute_tree(self, r):
+        """ Tree (dist, hops) of region r: shortest paths to its nearest node """
+
+        dist = self.distances(self.members[r])
+
+        return dist, self.next_hops(dist, self.members[r])
+
+    def tree(self, r):
+        """ Next hops towards region r """
+
+        return self.border[:, r]
+
+    def kept(self):
+        """ All the regions """
+
+        return range(len(self.members))
+
+    def kept_hops(self, r):
+        """ Next hops towards region r """
+
+        return self.border[:, r]
+
+    def changed(self):
+        """ The regions whose path lengths were computed, to update their trees """
+
+        return [r for r, dist in enumerate(self.dist) if dist is not None]
+
+    def get(self, r):
+        """ Tree (dist, hops) of region r; path lengths are computed the first time """
+
+        if self.dist[r] is None:
+            self.dist[r] = self.distances(self.members[r])
+
+        return self.dist[r], self.border[:, r]
+
+    def state(self):
+        """ The regions, the tables within them concatenated, and the border table """
+
+        return {"region": np.array(self.region, dtype=np.int32),
+                "tables": np.concatenate([table.table.ravel() for table in self.tables]),
+                "border": self.border}
+
+    def put(self, r, dist, hops):
+        """ Replaces the tree of region r """
+
+        self.dist[r] = dist
+        self.border[:, r] = hops
+
+    def next_hop(self, i, j, pkt_id=0):
+        """
+            Ordinal of the next hop node from node i towards node j: within
+            the region of j, on the table of the region, else on the border
+            table, or on a detour if j is cut off within its region (-1 if
+            there is no path)
+        """
+
+        if j in self.cut:
+            return int(self.detour(j)[i])
+
+        r = self.region[j]
+
+        if self.region[i] != r:
+            return int(self.border[i, r])
+
+        hop = self.tables[r].next_hop(self.local[i], self.local[j])
+        if hop < 0:
+            return -1
+
+        return int(self.members[r][hop])
+
+    def detour(self, j):
+        """ Next hops towards node j over the whole graph, computed if not kept """
+
+        hops = self.detours.get(j)
+
+        if hops is None:
+            _, hops = Routing.compute_tree(self, j)
+            self.detours[j] = hops
+
+        return hops
+
+    def update_cut(self, r):
+        """ Finds the nodes of region r that other nodes of the region cannot reach """
+
+        table = self.tables[r].table
+        for k in np.flatnonzero(np.any(table < 0, axis=0)).tolist():
+            self.cut.add(int(self.members[r][k]))
+
+    def link_down(self, i, k):
+        """ Takes the link between nodes i and k out of service, and updates the routes """
+
+        if (min(i, k), max(i, k)) in self.down:
+            return
+
+        super().link_down(i, k)
+
+        # detours may take the link
+        self.detours = {}
+
+        # a link within a region also changes the routes of the region
+        if self.region[i] == self.region[k]:
+            r = self.region[i]
+            self.tables[r].link_down(self.local[i], self.local[k])
+            self.update_cut(r)
+
+    def link_up(self, i, k):
+        """ Brings the link between nodes i and k back into service, and updates the routes """
+
+        if (min(i, k), max(i, k)) not in self.down:
+            return
+
+        super().link_up(i, k)
+
+        # detours may be shorter through the link
+        self.detours = {}
+
+        if self.region[i] == self.region[k]:
+            r = self.region[i]
+            self.tables[r].link_up(self.local[i], self.local[k])
+            self.cut.difference_update(self.members[r].tolist())
+            self.update_cut(r)
@@ -1,23 +1,37 @@
 """ Simulator.py """
 
+import functools
+
 import simpy
 
 from CS381_Simulator import Components
 from CS381_Simulator import Globals
+from CS381_Simulator import RandomStreams
+from CS381_Simulator import PacketIds
 
 
-def setup_network(env, M, verbose=Globals.VERB_NO):
-    """ Bind the model graph 'M' to the SimPy simulation environment 'env' """
+def setup_network(env, M, verbose=Globals.VERB_NO, channel_mode=Globals.CHANNEL_DELAY_LINE,
+                  recv_mode=Globals.RECV_CALLBACK, seed=None, replication=0, link_events=None):
+    """
+        Bind the model graph 'M' to the SimPy simulation environment 'env'.
+        Links go down and come back up as scheduled in 'link_events'
+        (see Network.Model.check_link_events()).
+    """
 
-    print(" [+] Found {:d} nodes and {:d} links".format(len(M.G.nodes()), len(M.G.edges())))
+    print(" [+] Found {:d} nodes and {:d} links".format(len(M.flat.node_names),
+                                                        len(M.flat.link_ends)))
 
     # create simulation network model
-    network = create_network_model(env, M, verbose)
+    network = create_network_model(env, M, verbose, channel_mode, recv_mode, seed, replication)
 
     # activate node interfaces (this sets SimPy processes)
     for node_name in network:
         network[node_name].if_up()
 
+    # take links down and bring them back up at the scheduled times
+    if link_events:
+        env.process(link_events_process(env, M, network, M.check_link_events(link_events)))
+
 ##        if node_name not in ['13', '14']:
 ##            network[node_name].if_up()           # double check it
             
@@ -30,18 +44,41 @@ def setup_network(env, M, verbose=Globals.VERB_NO):
     return network
 
 
-def create_network_model(env, M, verbose=Globals.VERB_NO):
-    """ Creates network: creates network nodes, binds connections to the nodes """
+def link_events_process(env, M, network, link_events):
+    """ Process that takes links down and brings them back up at the times in 'link_events' """
+
+    for t, n1, n2, state in link_events:
+
+        if t > env.now:
+            yield env.timeout(t - env.now)
+
+        # reroute around the link, then switch both of its channels
+        up = M.set_link_state(n1, n2, state)
+        network[n1].conns[n2].up = up
+        network[n2].conns[n1].up = up
+
+
+def create_network_model(env, M, verbose=Globals.VERB_NO, channel_mode=Globals.CHANNEL_DELAY_LINE,
+                         recv_mode=Globals.RECV_CALLBACK, seed=None, replication=0):
+    """
+        Creates network: creates network nodes, binds connections to the nodes.
+        Packet IDs are namespaced by node ordinal and 'replication' (see PacketIds).
+    """
 
     network = {}
+    F = M.flat
+
+    # one random number stream per node, all derived from 'seed'
+    streams = RandomStreams.node_streams(seed, len(F.node_names))
 
-    # create nodes
-    for node_name in M.G.nodes():
+    # create nodes, by node ordinal
+    for i, (node_name, stream) in enumerate(zip(F.node_names, streams)):
 
-        network[node_name] = Components.Node(env, M, node_name, verbose)
+        ids = PacketIds.IdAllocator(i, replication)
+        network[node_name] = Components.Node(env, M, node_name, verbose, recv_mode, stream, ids)
 
     # create node links
-    conn_dict = init_conn(env, M)
+    conn_dict = init_conn(env, M, channel_mode, recv_mode)
 
     # bind connections to the nodes
     for c in conn_dict:
@@ -58,39 +95,51 @@ def create_network_model(env, M, verbose=Globals.VERB_NO):
         network[node_name1].add_conn(node_name2, conn_1)
         network[node_name2].add_conn(node_name1, conn_2)
 
+        # packets lost on a link that is down are discarded by the sending node
+        conn_1.discard = network[node_name1].discard_packet
+        conn_2.discard = network[node_name2].discard_packet
+
+        # let the connections deliver straight to the receiving nodes
+        if recv_mode == Globals.RECV_CALLBACK:
+            conn_1.bind(functools.partial(network[node_name2].recv_pkt, node_name1))
+            conn_2.bind(functools.partial(network[node_name1].recv_pkt, node_name2))
+
     return network
 
 
-def init_conn(env, M):
+def init_conn(env, M, channel_mode=Globals.CHANNEL_DELAY_LINE, recv_mode=Globals.RECV_CALLBACK):
     """
     Creates connection pipes.
 
     Keys of 'conn_dict' are tuples that contain the two node names,
     and values are tuples that contain the two connection objects,
-    belongings to each node.
+    belongings to each node. 'channel_mode' selects how the
+    connections model the link latency (see Globals). Communication
+    pipes are only needed when nodes receive with 'if_recv' processes.
     """
 
     # initialise connections dictionary
     conn_dict = {}
+    F = M.flat
 
-    # loop over all edges in the network graph
-    for c in M.G.edges():
-
-        # fetch the link attributes for this edge
-        link_attr_dict = M.G[c[0]][c[1]]
-        # fetch the capacity and transmission delay for this link
-        link_capacity = link_attr_dict[Globals.LINK_CAPACITY_KWD]
-        transm_delay = link_attr_dict[Globals.LINK_TRANSM_DELAY_KWD]
+    # loop over all links, by link ordinal, with their capacity and transmission delay
+    for (i1, i2), link_capacity, transm_delay in zip(F.link_ends.tolist(),
+                                                      F.link_capacity.tolist(),
+                                                      F.link_transm_delay.tolist()):
 
         # create two communication pipes, 1->2 and 2->1
-        pipe_12 = simpy.Store(env, capacity=link_capacity)
-        pipe_21 = simpy.Store(env, capacity=link_capacity)
+        if recv_mode == Globals.RECV_PROCESS:
+            pipe_12 = simpy.Store(env, capacity=link_capacity)
+            pipe_21 = simpy.Store(env, capacity=link_capacity)
+        else:
+            pipe_12 = None
+            pipe_21 = None
 
         # create two connection objects
-        conn_1 = Components.Channel(env, transm_delay, pipe_12, pipe_21)
-        conn_2 = Components.Channel(env, transm_delay, pipe_21, pipe_12)
+        conn_1 = Components.Channel(env, transm_delay, pipe_12, pipe_21, channel_mode)
+        conn_2 = Components.Channel(env, transm_delay, pipe_21, pipe_12, channel_mode)
 
         # add the connection to the dictionary
-        conn_dict[c] = (conn_1, conn_2)
+        conn_dict[(F.node_names[i1], F.node_names[i2])] = (conn_1, conn_2)
 
     return conn_dict
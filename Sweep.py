@@ -0,0 +1,261 @@
+""" Sweep.py """
+
+import os
+import copy
+import json
+import argparse
+import itertools
+import contextlib
+import concurrent.futures
+
+from . import Globals
+from . import Utils
+from . import IO
+from . import ModelUtils
+from . import Driver
+from . import TraceUtils
+
+
+# Columns of the results table that identify a run (see run_sweep())
+POINT = 'point'
+REPLICATION = 'replication'
+
+# Node parameters that the parameter files may leave out (see Network.FlatModel)
+OPTIONAL_NODE_PARAMS = [Globals.NODE_QUANTUM_KWD]
+
+
+def param_grid(grid):
+    """
+        Takes a dictionary of parameter override keys (see apply_overrides())
+        and lists of values, returns the list of all the combinations of the
+        values, as override dictionaries
+    """
+
+    keys = list(grid.keys())
+
+    points = []
+    for values in itertools.product(*[grid[key] for key in keys]):
+        points.append(dict(zip(keys, values)))
+
+    return points
+
+
+def apply_overrides(param, overrides):
+    """
+        Returns a copy of the network parameters 'param' (see
+        ModelUtils.load_param()) with the values of 'overrides'. Keys are
+        'section.name', to set the parameter 'name' of one node type or
+        link type section, e.g. "server.node_proc_delay" or
+        "router-router.link_capacity", or a bare parameter name, to set it
+        in every section that has it. The parameter must be in the section,
+        except for the optional node parameters (see OPTIONAL_NODE_PARAMS),
+        which can be set for a node type, or bare for every node type.
+    """
+
+    param = copy.deepcopy(param)
+
+    for key in overrides:
+
+        if '.' in key:
+            section, name = key.split('.', 1)
+            if section not in param:
+                Utils.error("No parameter section '{:s}' for '{:s}'".format(section, key))
+            if name not in param[section] and not (name in OPTIONAL_NODE_PARAMS and
+                                                   Globals.NODE_PKT_RATE_KWD in param[section]):
+                Utils.error("No parameter '{:s}' in section '{:s}'".format(name, section))
+            sections = [section]
+        else:
+            name = key
+            sections = [section for section in param if name in param[section]]
+            if len(sections) == 0 and name in OPTIONAL_NODE_PARAMS:
+                sections = [section for section in param
+                            if Globals.NODE_PKT_RATE_KWD in param[section]]
+            if len(sections) == 0:
+                Utils.error("No parameter section has '{:s}'".format(key))
+
+        for section in sections:
+            param[section][name] = copy.deepcopy(overrides[key])
+
+    return param
+
+
+# Network model and parameters of the sweep run by a worker process (see init_worker()),
+# and the models of the sweep points it ran, by point
+worker_model = None
+worker_param = None
+worker_points = {}
+
+
+def run_sweep(M, param, t, points, n=1, jobs=1, seed=None, **kwargs):
+    """
+        Runs 'n' replications of the simulation of the network model 'M'
+        for 't' time units at every point of 'points', a list of override
+        dictionaries on top of the network parameters 'param' (see
+        apply_overrides(), param_grid()), 'jobs' runs at a time in worker
+        processes (all the processors with jobs=None). Every point reuses
+        the topology and routes of 'M' (see Network.Model.with_param()).
+        Replication k is seeded as in Driver.run_replications(), with the
+        same seed at every point; the other keyword arguments are passed on
+        to Driver.run_sim(). Returns the results table: one row per point
+        and replication, with the point and replication numbers, the
+        overrides and the summary statistics (see TraceUtils.summary_stats()).
+    """
+
+    if kwargs.get('output_dir') is not None or kwargs.get('stream_traces'):
+        Utils.error("Sweeps do not save traces")
+
+    # check all the override keys up front, rather than in the workers
+    for overrides in points:
+        apply_overrides(param, overrides)
+
+    print(" [+] Running {:d} points x {:d} replications of {:.2f} time units"
+          .format(len(points), n, t))
+
+    seeds = Driver.replication_seeds(seed, n)
+
+    tasks = []
+    for point, overrides in enumerate(points):
+        for k, replication_seed in enumerate(seeds):
+            tasks.append((point, overrides, t, replication_seed, k, kwargs))
+
+    if jobs == 1:
+        init_worker(M, param)
+        rows = list(map(run_point, tasks))
+    else:
+        # the model is sent once to each worker, not once per run
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                                    initargs=(M, param)) as pool:
+            rows = list(pool.map(run_point, tasks))
+
+    print(" [+] Sweep completed")
+
+    return rows
+
+
+def init_worker(M, param):
+    """ Sets the network model and parameters of the sweep run by this process """
+
+    global worker_model, worker_param, worker_points
+    worker_model = M
+    worker_param = param
+    worker_points = {}
+
+
+def run_point(task):
+    """
+        Runs one replication of one sweep point, the task 'task', a (point,
+        overrides, t, seed, replication, run_sim() keyword arguments) tuple,
+        silently; returns its row of the results table
+    """
+
+    point, overrides, t, seed, replication, kwargs = task
+
+    with open(os.devnull, "w") as fp, contextlib.redirect_stdout(fp):
+
+        # the model of the point, on the topology of the sweep model
+        if point not in worker_points:
+            worker_points[point] = worker_model.with_param(apply_overrides(worker_param, overrides))
+
+        network = Driver.run_sim(worker_points[point], t, seed=seed, replication=replication,
+                                 **kwargs)
+
+    row = {POINT: point, REPLICATION: replication}
+    row.update(overrides)
+    row.update(TraceUtils.summary_stats(network, until=t))
+
+    return row
+
+
+def save_table(rows, file_path):
+    """ Saves the results table 'rows' (see run_sweep()) as a CSV file """
+
+    # columns in order of first appearance
+    columns = []
+    for row in rows:
+        for column in row:
+            if column not in columns:
+                columns.append(column)
+
+    fp = IO.open_for_writing(file_path)
+
+    fp.write(",".join(columns) + "\n")
+    for row in rows:
+        fields = []
+        for column in columns:
+            fields.append(format_value(row.get(column, "")))
+        fp.write(",".join(fields) + "\n")
+
+    IO.close_for_writing(fp)
+
+    print(" [+] Results table saved as '{:s}'".format(file_path))
+
+
+def format_value(value):
+    """ CSV field of the value 'value': lists (distributions) as quoted JSON """
+
+    if isinstance(value, (list, dict)):
+        return '"' + json.dumps(value).replace('"', '""') + '"'
+
+    return str(value)
+
+
+def parse_override(text):
+    """
+        Takes a 'key=value1;value2;...' command line override, returns the
+        key and the list of values; values are JSON (numbers, lists), or
+        else strings
+    """
+
+    if '=' not in text:
+        Utils.error("Override '{:s}' is not key=values".format(text))
+
+    key, values = text.split('=', 1)
+
+    parsed = []
+    for value in values.split(';'):
+        try:
+            parsed.append(json.loads(value))
+        except ValueError:
+            parsed.append(value)
+
+    return key, parsed
+
+
+def main(args=None):
+    """
+        Command line sweep: loads a model, runs a sweep over the grid of
+        the --set overrides, and saves the results table
+    """
+
+    parser = argparse.ArgumentParser(description="Sweep the parameters of a network model")
+    parser.add_argument("model_name", help="model name (TOPO, TYPE and PARAM files)")
+    parser.add_argument("-i", "--input-dir", default=".", help="directory of the model files")
+    parser.add_argument("-t", "--time", type=float, required=True, help="simulation time")
+    parser.add_argument("-s", "--set", action="append", default=[], metavar="KEY=V1;V2",
+                        help="parameter override values (see apply_overrides()), repeatable")
+    parser.add_argument("-n", "--replications", type=int, default=1,
+                        help="replications per point")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="worker processes (all the processors by default)")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the replications")
+    parser.add_argument("--engine", default=Globals.ENGINE_SIMPY, help="simulation engine")
+    parser.add_argument("--cache-dir", default=None, help="compiled model cache directory")
+    parser.add_argument("-o", "--output", default="sweep.csv", help="results table file")
+    args = parser.parse_args(args)
+
+    grid = {}
+    for text in args.set:
+        key, values = parse_override(text)
+        grid[key] = values
+
+    M = ModelUtils.load_model(args.model_name, args.input_dir, args.cache_dir)
+    param = ModelUtils.load_param(args.model_name, args.input_dir)
+
+    rows = run_sweep(M, param, args.time, param_grid(grid), n=args.replications, jobs=args.jobs,
+                     seed=args.seed, engine=args.engine)
+
+    save_table(rows, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+""" TraceReader.py """
+
+import mmap
+import os
+
+import numpy as np
+
+from . import Globals
+from . import IO
+from . import Utils
+from . import TraceWriter
+from . import TraceRecorder
+from . import TraceUtils
+
+
+def open_results(output_dir):
+    """ Opens the binary traces saved in 'output_dir' (see ResultSet) """
+
+    return ResultSet(output_dir)
+
+
+def map_file(file_path):
+    """ Memory-maps the binary trace file or trace container 'file_path' (see TraceWriter) """
+
+    fp = IO.open_for_reading(file_path, binary=True)
+    buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    IO.close_for_reading(fp)
+
+    magic, version = TraceWriter.FILE_HEADER.unpack_from(buf, 0)
+    if magic != TraceWriter.MAGIC or version > TraceWriter.VERSION:
+        Utils.error("'{:s}' is not a binary trace file".format(file_path))
+
+    return buf
+
+
+def unmap(buf):
+    """
+        Unmaps the memory-mapped file 'buf'; while NumPy arrays of its data
+        are still held, they keep the mapping, which goes with the last of them
+    """
+
+    try:
+        buf.close()
+    except BufferError:
+        # exported pointers exist: the arrays keep a reference to the map
+        pass
+
+
+class ResultSet:
+    """
+        Binary traces of one simulation run, as saved by Driver.run_sim()
+        with trace_format="binary" or "container". Nothing is read up front:
+        trace files are memory-mapped the first time one of their traces is
+        asked for, and of a trace container only the index is read. Arrays
+        of column data map the files in place, and stay valid after close()
+        until they are released.
+    """
+
+    def __init__(self, output_dir):
+
+        self.output_dir = output_dir
+        self.files = {}
+        self.node_list = None
+
+        self.container = None
+        container_path = os.path.join(output_dir, Globals.TRACE_CONTAINER_FILE)
+        if os.path.exists(container_path):
+            self.container = MappedContainer(container_path)
+
+    def node_names(self):
+        """ Names of the nodes of the run """
+
+        if self.container is not None:
+            return self.container.node_names
+
+        if self.node_list is None:
+            self.node_list = IO.file_lines(os.path.join(self.output_dir, Globals.NODES_LIST_FILE))
+
+        return self.node_list
+
+    def mapped_file(self, file_name):
+        """ The memory-mapped trace file 'file_name' of the run """
+
+        if file_name not in self.files:
+            self.files[file_name] = MappedFile(os.path.join(self.output_dir, file_name))
+
+        return self.files[file_name]
+
+    def trace(self, node_name, queue_type):
+        """ Packet trace of type 'queue_type' ('g', 'f', 'r', 'd') of the node 'node_name' """
+
+        if self.container is not None:
+            return self.container.view(node_name, queue_type)
+
+        file_name = node_name + TraceUtils.trace_suffix(queue_type, Globals.TRACE_FORMAT_BINARY)
+
+        return self.mapped_file(file_name).view()
+
+    def queue(self, node_name):
+        """ Queue monitor change points of the node 'node_name' """
+
+        if self.container is not None:
+            return self.container.view(node_name, TraceWriter.QUEUE_TRACE)
+
+        file_name = node_name + TraceUtils.queue_suffix(Globals.TRACE_FORMAT_BINARY)
+
+        return self.mapped_file(file_name).view()
+
+    def close(self):
+        """ Unmaps all the trace files (see unmap()) """
+
+        for file_name in self.files:
+            self.files[file_name].close()
+
+        self.files = {}
+
+        if self.container is not None:
+            self.container.close()
+            self.container = None
+
+
+class MappedFile:
+    """
+        Memory-mapped binary trace file (see TraceWriter). Opening it only
+        reads the chunk headers; the column data are paged in when used.
+    """
+
+    def __init__(self, file_path):
+
+        self.file_path = file_path
+        self.buf = map_file(file_path)
+
+        # chunk headers and the offsets of their column data
+        self.chunks = []
+        offset = TraceWriter.FILE_HEADER.size
+
+        while offset < len(self.buf):
+            header, data_offset, offset = TraceWriter.decode_chunk_header(self.buf, offset)
+            if header["kind"] == TraceWriter.KIND_INDEX:
+                Utils.error("'{:s}' is a trace container".format(file_path))
+            self.chunks.append((header, data_offset))
+
+    def view(self):
+        """ Lazy view of all the rows of the file """
+
+        return TraceView(self.buf, self.chunks)
+
+    def close(self):
+        """
+            Unmaps the file (see unmap()); views of it must not be used
+            afterwards, arrays taken from them stay valid until released
+        """
+
+        unmap(self.buf)
+
+
+class MappedContainer:
+    """
+        Memory-mapped trace container (see TraceWriter.ContainerWriter).
+        Opening it only reads the index; the chunk headers of a trace are
+        read the first time the trace is asked for.
+    """
+
+    def __init__(self, file_path):
+
+        self.file_path = file_path
+        self.buf = map_file(file_path)
+
+        index_offset, magic = TraceWriter.TRAILER.unpack_from(self.buf,
+                                                              len(self.buf) - TraceWriter.TRAILER.size)
+        if magic != TraceWriter.MAGIC:
+            Utils.error("'{:s}' is not a complete trace container".format(file_path))
+
+        header, _, _ = TraceWriter.decode_chunk_header(self.buf, index_offset)
+        self.node_names = header["nodes"]
+        self.index = header["index"]
+
+        # (node name, trace type) -> chunk headers and column data offsets
+        self.traces = {}
+
+    def view(self, node_name, trace):
+        """ Lazy view of the trace type 'trace' of the node 'node_name' """
+
+        if (node_name, trace) not in self.traces:
+
+            offsets = self.index.get(node_name, {}).get(trace)
+            if offsets is None:
+                Utils.error("No trace '{:s}' of node '{:s}' in '{:s}'".format(trace, node_name,
+                                                                             self.file_path))
+
+            chunks = []
+            for offset in offsets:
+                header, data_offset, _ = TraceWriter.decode_chunk_header(self.buf, offset)
+                chunks.append((header, data_offset))
+
+            self.traces[(node_name, trace)] = chunks
+
+        return TraceView(self.buf, self.traces[(node_name, trace)])
+
+    def close(self):
+        """
+            Unmaps the file (see unmap()); views of it must not be used
+            afterwards, arrays taken from them stay valid until released
+        """
+
+        unmap(self.buf)
+
+
+class TraceView:
+    """
+        Lazy view of the rows 'start' to 'stop' of a trace stored in the
+        binary chunks 'chunks' of the buffer 'buf'. Columns are returned
+        as ChunkedColumn objects that map the file data in place.
+    """
+
+    def __init__(self, buf, chunks, start=0, stop=None):
+
+        self.buf = buf
+        self.chunks = chunks
+
+        # first row of each chunk, and the total number of rows
+        self.offsets = [0]
+        for header, _ in chunks:
+            self.offsets.append(self.offsets[-1] + header["rows"])
+
+        if stop is None:
+            stop = self.offsets[-1]
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+
+        return self.stop - self.start
+
+    def names(self):
+        """ Names of the columns """
+
+        if len(self.chunks) == 0:
+            return []
+
+        return [column["name"] for column in self.chunks[0][0]["columns"]]
+
+    def labels(self, name):
+        """ Labels of the category codes of the categorical column 'name' """
+
+        labels = []
+        for header, _ in self.chunks:
+            labels = header.get("labels", {}).get(name, labels)
+
+        return labels
+
+    def column(self, name):
+        """ Lazy view of the column 'name' (category codes for the categorical columns) """
+
+        return ChunkedColumn(self, name, self.start, self.stop)
+
+    def decoded(self, name):
+        """ NumPy array of the labels of the categorical column 'name' """
+
+        return TraceRecorder.decode(self.labels(name), np.asarray(self.column(name)))
+
+    def rows(self, start, stop):
+        """ View of the rows 'start' to 'stop' of this view """
+
+        start = min(max(self.start + start, self.start), self.stop)
+        stop = min(max(self.start + stop, start), self.stop)
+
+        view = TraceView.__new__(TraceView)
+        view.buf = self.buf
+        view.chunks = self.chunks
+        view.offsets = self.offsets
+        view.start = start
+        view.stop = stop
+
+        return view
+
+    def window(self, t_start, t_end):
+        """ View of the rows recorded at simulation times 't_start' <= stime < 't_end' """
+
+        # rows are recorded in time order, so both ends are found by bisection
+        stime = self.column(Globals.STIME)
+
+        return self.rows(stime.searchsorted(t_start), stime.searchsorted(t_end))
+
+    def chunk_column(self, k, name):
+        """ The column 'name' of the chunk 'k', mapped in place """
+
+        header, data_offset = self.chunks[k]
+        for column in header["columns"]:
+            if column["name"] == name:
+                return np.frombuffer(self.buf, dtype=column["dtype"], count=header["rows"],
+                                     offset=data_offset + column["offset"])
+
+        Utils.error("Unknown trace column '{:s}'".format(name))
+
+
+class ChunkedColumn:
+    """
+        Lazy view of the rows 'start' to 'stop' of the column 'name' of
+        the trace view 'trace'. Slicing returns another lazy view; the data
+        are only touched by indexing, iteration over chunks, or conversion
+        with np.asarray(), which is zero-copy within a single chunk.
+    """
+
+    def __init__(self, trace, name, start, stop):
+
+        self.trace = trace
+        self.name = name
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+
+        return self.stop - self.start
+
+    def parts(self):
+        """ Zero-copy NumPy views of the column data, one per chunk """
+
+        offsets = self.trace.offsets
+        for k in range(len(offsets) - 1):
+            lo = max(self.start, offsets[k])
+            hi = min(self.stop, offsets[k + 1])
+            if lo < hi:
+                yield self.trace.chunk_column(k, self.name)[lo - offsets[k]:hi - offsets[k]]
+
+    def __array__(self, dtype=None, copy=None):
+
+        parts = list(self.parts())
+
+        if len(parts) == 0:
+            values = np.empty(0, dtype=self.column_dtype())
+        elif len(parts) == 1:
+            values = parts[0]
+        else:
+            values = np.concatenate(parts)
+
+        if dtype is not None:
+            values = values.astype(dtype, copy=False)
+
+        return values
+
+    def column_dtype(self):
+        """ NumPy type of the column """
+
+        for column in self.trace.chunks[0][0]["columns"]:
+            if column["name"] == self.name:
+                return np.dtype(column["dtype"])
+
+        Utils.error("Unknown trace column '{:s}'".format(self.name))
+
+    def __getitem__(self, key):
+
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                return np.asarray(self)[key]
+            return ChunkedColumn(self.trace, self.name, self.start + start, self.start + max(start, stop))
+
+        if key < 0:
+            key += len(self)
+        if key < 0 or key >= len(self):
+            raise IndexError("trace row index out of range")
+
+        return next(ChunkedColumn(self.trace, self.name, self.start + key, self.start + key + 1).parts())[0]
+
+    def searchsorted(self, value):
+        """ Index at which 'value' would be inserted to keep the (sorted) column sorted """
+
+        # skip whole chunks on their last row, then bisect within one chunk
+        index = 0
+        for part in self.parts():
+            if len(part) > 0 and part[-1] < value:
+                index += len(part)
+            else:
+                return index + int(np.searchsorted(part, value))
+
+        return index
@@ -0,0 +1,230 @@
+""" TraceRecorder.py """
+
+import numpy as np
+
+from . import Globals
+
+
+# Trace columns: (name, NumPy type). The packet fields are snapshotted
+# when the packet is recorded; text fields are stored as category codes.
+COLUMNS = ((Globals.STIME, np.float64),
+           (Globals.TIME_STAMP, np.float64),
+           (Globals.ID, np.uint64),
+           (Globals.TYPE, np.int32),
+           (Globals.SOURCE, np.int32),
+           (Globals.DEST_NODE, np.int32),
+           (Globals.HOP_NODE, np.int32),
+           (Globals.NO_HOPS, np.int64),
+           (Globals.NO_ROUNDS, np.int64),
+           (Globals.CPU_BURST, np.float64),
+           (Globals.SIZE, np.int64),
+           (Globals.SERVICE_TIME, np.float64))
+
+# Columns that hold category codes (see TraceRecorder.labels)
+CATEGORIES = (Globals.TYPE, Globals.SOURCE, Globals.DEST_NODE, Globals.HOP_NODE)
+
+# Columns without rows, shared by all the traces until they grow (see TraceRecorder.grow())
+EMPTY_COLUMNS = dict((name, np.empty(0, dtype=dtype)) for name, dtype in COLUMNS)
+
+
+class TraceRecorder:
+    """
+        Columnar packet trace. record() snapshots the packet fields into a
+        row buffer, which is copied into growable NumPy columns (one per
+        field) every 'block' rows, so the trace can be filtered and
+        aggregated with array operations. Once streamed to a sink (see
+        stream_to()), every block is written out instead, and the columns
+        only hold the rows not yet written.
+    """
+
+    def __init__(self, block=Globals.TRACE_BLOCK_SIZE):
+
+        self.block = block
+        self.pending = []
+
+        # number of rows copied into the columns, and the column capacity;
+        # the columns are only allocated once rows are copied into them
+        self.n = 0
+        self.capacity = 0
+        self.cols = dict(EMPTY_COLUMNS)
+
+        # per categorical column: labels in code order, and label -> code
+        self.labels = {}
+        self.codes = {}
+        for name in CATEGORIES:
+            self.labels[name] = []
+            self.codes[name] = {}
+
+        # trace writer the blocks are streamed to, and the rows written so far
+        self.sink = None
+        self.written = 0
+
+    def __len__(self):
+
+        return self.written + self.n + len(self.pending)
+
+    def record(self, now, pkt):
+        """ Records the packet 'pkt' at simulation time 'now' """
+
+        self.pending.append((now, pkt.time_stamp, pkt.id, pkt.type, pkt.source, pkt.dest_node,
+                             pkt.hop_node, pkt.no_hops, pkt.no_rounds, pkt.cpu_burst,
+                             pkt.size, pkt.service_time))
+
+        if len(self.pending) >= self.block:
+            self.flush()
+
+    def encode(self, name, values):
+        """ Category codes of the labels 'values' of the column 'name' """
+
+        labels = self.labels[name]
+        codes = self.codes[name]
+
+        for value in dict.fromkeys(values):
+            if value not in codes:
+                codes[value] = len(labels)
+                labels.append(value)
+
+        return [codes[value] for value in values]
+
+    def flush(self):
+        """ Copies the buffered rows into the columns, or writes them to the sink """
+
+        if len(self.pending) == 0:
+            return
+
+        rows = len(self.pending)
+
+        chunk = {}
+        for (name, dtype), values in zip(COLUMNS, zip(*self.pending)):
+            if name in CATEGORIES:
+                values = self.encode(name, values)
+            chunk[name] = np.array(values, dtype=dtype)
+
+        self.pending = []
+
+        if self.sink is not None:
+            self.sink.write_pkts(chunk, self.labels)
+            self.written += rows
+            return
+
+        if self.n + rows > self.capacity:
+            self.grow(self.n + rows)
+
+        for name in chunk:
+            self.cols[name][self.n:self.n + rows] = chunk[name]
+
+        self.n += rows
+
+    def stream_to(self, sink):
+        """
+            Writes the rows recorded so far, and from now on every block of
+            'block' rows, to the trace writer 'sink' (see TraceWriter)
+        """
+
+        self.flush()
+
+        if self.n > 0:
+            sink.write_pkts(self.columns(), self.labels)
+            self.written += self.n
+
+        # release the columns
+        self.n = 0
+        self.capacity = 0
+        self.cols = dict(EMPTY_COLUMNS)
+
+        self.sink = sink
+
+    def close(self):
+        """ Writes the buffered rows to the sink, if any, and closes it """
+
+        self.flush()
+
+        if self.sink is not None:
+            self.sink.close()
+            self.sink = None
+
+    def grow(self, rows):
+        """ At least doubles the column capacity, to hold 'rows' rows """
+
+        capacity = max(rows, 2 * self.capacity)
+        for name in self.cols:
+            col = np.empty(capacity, dtype=self.cols[name].dtype)
+            col[:self.n] = self.cols[name][:self.n]
+            self.cols[name] = col
+
+        self.capacity = capacity
+
+    def column(self, name):
+        """ View of the column 'name' (category codes for the categorical columns) """
+
+        self.flush()
+
+        return self.cols[name][:self.n]
+
+    def columns(self):
+        """ Dictionary of views of all the columns, keyed by column name """
+
+        self.flush()
+
+        cols = {}
+        for name, _ in COLUMNS:
+            cols[name] = self.cols[name][:self.n]
+
+        return cols
+
+    def decode(self, name, codes=None):
+        """ Labels of the category codes 'codes' (default: the whole column) of column 'name' """
+
+        if codes is None:
+            codes = self.column(name)
+
+        return decode(self.labels[name], codes)
+
+    def where(self, **conditions):
+        """
+            Boolean mask of the rows whose columns equal the given values,
+            e.g. where(type="Process", dest_node="25")
+        """
+
+        self.flush()
+        mask = np.ones(self.n, dtype=bool)
+
+        for name, value in conditions.items():
+            if name in CATEGORIES:
+                # a label that was never recorded matches no row
+                value = self.codes[name].get(value, -1)
+            mask &= self.column(name) == value
+
+        return mask
+
+    def count_by(self, name, mask=None):
+        """ Dictionary of the number of rows (selected by 'mask') per label of the categorical column 'name' """
+
+        codes = self.column(name)
+        if mask is not None:
+            codes = codes[mask]
+
+        counts = np.bincount(codes, minlength=len(self.labels[name]))
+
+        return dict(zip(self.labels[name], counts.tolist()))
+
+    def mean(self, name, mask=None):
+        """ Mean of the column 'name' over the rows selected by 'mask' (NaN if none) """
+
+        values = self.column(name)
+        if mask is not None:
+            values = values[mask]
+
+        if len(values) == 0:
+            return np.nan
+
+        return float(values.mean())
+
+
+def decode(labels, codes):
+    """ NumPy array of the labels 'labels' of the category codes 'codes' """
+
+    label_array = np.empty(len(labels), dtype=object)
+    label_array[:] = labels
+
+    return label_array[codes]
@@ -2,13 +2,22 @@
 
 import os
 
+import numpy as np
+
 from . import Globals
 from . import IO
 from . import Utils
+from . import TraceWriter
+from . import TraceRecorder
+
+
+# Summary statistics of a run (see summary_stats())
+SUMMARY_STATS = ('sent', 'recv', 'throughput', 'generated', 'forwarded', 'discarded', 'received',
+                 'latency', 'queue_length')
 
 
-def print_stats(network, verbose=Globals.VERB_NO):
-    """ Print statistics collected during the simulation run """
+def print_stats(network, verbose=Globals.VERB_NO, until=None):
+    """ Print statistics collected during the simulation run, which ended at time 'until' """
 
     print(" [+] Printing summary statistics:")
 
@@ -30,6 +39,9 @@ def print_stats(network, verbose=Globals.VERB_NO):
                   .format(len(node.generated)))
             print("\t Total packets forwarded: {:,}"
                   .format(len(node.forwarded)))
+            print("\t Queue length: mean {:.3f}, 95th percentile {:d}, max {:d}"
+                  .format(node.queue_mon.mean(until), node.queue_mon.percentile(95, until),
+                          node.queue_mon.max))
 
         for c in node.conns:
 
@@ -53,6 +65,67 @@ def print_stats(network, verbose=Globals.VERB_NO):
     print("\tThroughput: {:,}\n".format(grand_tot_recv / grand_tot_sent))
 
 
+def summary_stats(network, until=None):
+    """
+        Summary statistics of the simulation run, which ended at time 'until',
+        as a dictionary of numbers (see SUMMARY_STATS): the packet totals of
+        print_stats(), the mean latency of the received packets, and the
+        mean queue length over the nodes. The latency is taken from the
+        received packet traces, which must not have been streamed to files.
+    """
+
+    stats = dict.fromkeys(SUMMARY_STATS, 0)
+    latency_sum = 0.0
+    queue_sum = 0.0
+
+    for n in network:
+
+        node = network[n]
+
+        for c in node.conns:
+            stats['sent'] += node.pkt_sent[c]
+            stats['recv'] += node.pkt_recv[c]
+
+        stats['generated'] += len(node.generated)
+        stats['forwarded'] += len(node.forwarded)
+        stats['discarded'] += len(node.discarded)
+        stats['received'] += len(node.received)
+
+        # received packets, from their time stamp to their arrival
+        if node.received.written > 0 or node.received.sink is not None:
+            Utils.error("Summary statistics need the packet traces in memory, not streamed")
+        latency_sum += float(np.sum(node.received.column(Globals.STIME) -
+                                    node.received.column(Globals.TIME_STAMP)))
+        queue_sum += node.queue_mon.mean(until)
+
+    stats['throughput'] = stats['recv'] / stats['sent'] if stats['sent'] > 0 else float('nan')
+    stats['latency'] = latency_sum / stats['received'] if stats['received'] > 0 else float('nan')
+    stats['queue_length'] = queue_sum / len(network) if len(network) > 0 else float('nan')
+
+    return stats
+
+
+def print_replication_stats(stats, confidence=Globals.CONFIDENCE_LEVEL):
+    """
+        Prints the means over replications of the summary statistics 'stats'
+        (one dictionary per replication, see summary_stats()), with their
+        'confidence' confidence intervals. Returns them as a dictionary of
+        (mean, confidence interval half width) pairs.
+    """
+
+    print(" [+] Summary statistics over {:d} replications ({:.0f}% confidence intervals):"
+          .format(len(stats), 100 * confidence))
+
+    summary = {}
+    for name in SUMMARY_STATS:
+        summary[name] = Utils.mean_ci([s[name] for s in stats], confidence)
+        print("\t{:s}: {:,.6g} +/- {:,.3g}".format(name, summary[name][0], summary[name][1]))
+
+    print("")
+
+    return summary
+
+
 def save_node_names(network, output_dir):
     """ Save the list of node names """
 
@@ -70,8 +143,14 @@ def save_node_names(network, output_dir):
     IO.close_for_writing(fp)
 
 
-def save_queue_mon(output_dir, network):
-    """ For each node, saves node queue length as a function of simulation time """
+def save_queue_mon(output_dir, network, deltat=None, until=None,
+                   trace_format=Globals.TRACE_FORMAT_CSV, container=None):
+    """
+        For each node, saves node queue length as a function of simulation time:
+        the change points recorded by the queue monitor, or, if 'deltat' is
+        given, the queue length resampled every 'deltat' time units until 'until'.
+        With the container format, they are written to 'container' (see open_container()).
+    """
 
     print(" [+] Saving queue monitors..")
 
@@ -81,37 +160,81 @@ def save_queue_mon(output_dir, network):
     for node_name in node_names:
 
         node = network[node_name]
-        node_name = node.name
 
-        file_name = node_name + Globals.QUEUE_SUFFIX
-        output_file = os.path.join(output_dir, file_name)
+        # (time, queue_length) pairs, at change points or on a regular grid
+        if deltat is None:
+            stimes = node.queue_mon.times
+            lengths = node.queue_mon.lengths
+        else:
+            stimes, lengths = node.queue_mon.resample(deltat, until)
+            stimes = stimes.tolist()
+            lengths = lengths.tolist()
 
-        fp = IO.open_for_writing(output_file)
+        writer = open_writer(output_dir, node.name, TraceWriter.QUEUE_TRACE, trace_format, container)
+        writer.write_queue(stimes, lengths)
+        writer.close()
 
-        # each element of node.queue_mon is a list [time_now, queue_length]
-        fp.write("stime,queue_length\n")
-        for item in node.queue_mon:
-            fp.write("{:f},{:d}\n".format(item[0], item[1]))
 
-        IO.close_for_writing(fp)
+def trace_suffix(queue_type, trace_format=Globals.TRACE_FORMAT_CSV):
+    """ File name suffix of the packet traces of type 'queue_type' in the format 'trace_format' """
 
-def save_node_pkts(network, output_dir, queue_type):
-    """ For given queue type: for all nodes saves all packets to a file """
+    binary = trace_format == Globals.TRACE_FORMAT_BINARY
+
+    if queue_type == 'g':
+        suffix = Globals.GEN_BIN_SUFFIX if binary else Globals.GEN_SUFFIX
+    elif queue_type == 'f':
+        suffix = Globals.FWD_BIN_SUFFIX if binary else Globals.FWD_SUFFIX
+    elif queue_type == 'd':
+        suffix = Globals.DISCARD_BIN_SUFFIX if binary else Globals.DISCARD_SUFFIX
+    elif queue_type == 'r':
+        suffix = Globals.RECV_BIN_SUFFIX if binary else Globals.RECV_SUFFIX
+    else:
+        Utils.error("Unknown queue '{:s}'".format(queue_type))
+
+    return suffix
+
+
+def queue_suffix(trace_format=Globals.TRACE_FORMAT_CSV):
+    """ File name suffix of the queue monitors in the format 'trace_format' """
+
+    if trace_format == Globals.TRACE_FORMAT_BINARY:
+        return Globals.QUEUE_BIN_SUFFIX
+
+    return Globals.QUEUE_SUFFIX
+
+
+def node_trace(node, queue_type):
+    """ Packet trace (see TraceRecorder) of type 'queue_type' of 'node' """
+
+    if queue_type == 'g':
+        queue = node.generated
+    elif queue_type == 'f':
+        queue = node.forwarded
+    elif queue_type == 'd':
+        queue = node.discarded
+    elif queue_type == 'r':
+        queue = node.received
+    else:
+        Utils.error("Unknown queue 2 '{:s}'".format(queue_type))
+
+    return queue
+
+
+def save_node_pkts(network, output_dir, queue_type, trace_format=Globals.TRACE_FORMAT_CSV,
+                   container=None):
+    """
+        For given queue type: for all nodes saves all packets to a file, or,
+        with the container format, to 'container' (see open_container())
+    """
 
     if queue_type == 'g':
         print(" [+] Saving generated packets..")
-        suffix = Globals.GEN_SUFFIX
     elif queue_type == 'f':
         print(" [+] Saving forwarded packets..")
-        suffix = Globals.FWD_SUFFIX
     elif queue_type == 'd':
         print(" [+] Saving discarded packets..")
-        suffix = Globals.DISCARD_SUFFIX
     elif queue_type == 'r':
         print(" [+] Saving received packets..")
-        suffix = Globals.RECV_SUFFIX
-    else:
-        Utils.error("Unknown queue '{:s}'".format(queue_type))
 
     node_names = list(network.keys())
     node_names.sort()
@@ -119,30 +242,11 @@ def save_node_pkts(network, output_dir, queue_type):
     for node_name in node_names:
 
         node = network[node_name]
+        queue = node_trace(node, queue_type)
 
-        if queue_type == 'g':
-            queue = node.generated
-        elif queue_type == 'f':
-            queue = node.forwarded
-        elif queue_type == 'd':
-            queue = node.discarded
-        elif queue_type == 'r':
-            queue = node.received
-        else:
-            Utils.error("Unknown queue 2 '{:s}'".format(queue_type))
-
-        file_name = node.name + suffix
-        node_file = os.path.join(output_dir, file_name)
-
-        fp = IO.open_for_writing(node_file)
-        fp.write("stime,timestamp,id,status,cpu_burst,no_rounds,source,dest,nhops,size,service_time\n")
-
-        for item in queue:
-            stime, pkt = item
-            fp.write("{:f},{:f},{:s},{:s},{:f},{:d},{:s},{:s},{:d},{:d},{:f} \n"
-                     .format(stime, pkt[Globals.TIME_STAMP], pkt[Globals.ID], pkt[Globals.TYPE], pkt[Globals.CPU_BURST], pkt[Globals.NO_ROUNDS],
-                             pkt[Globals.SOURCE], pkt[Globals.DEST_NODE],  pkt[Globals.NO_HOPS], pkt[Globals.SIZE], pkt[Globals.SERVICE_TIME]))
-        IO.close_for_writing(fp)
+        writer = open_writer(output_dir, node.name, queue_type, trace_format, container)
+        writer.write_pkts(queue.columns(), queue.labels)
+        writer.close()
 
 
             #stime: f
@@ -154,3 +258,126 @@ def save_node_pkts(network, output_dir, queue_type):
             # dest_node: s
             #No Rounds: d
             #cpu burst: f
+
+
+def open_container(network, output_dir):
+    """ Opens the trace container of the run in 'output_dir' (see TraceWriter.ContainerWriter) """
+
+    node_names = list(network.keys())
+    node_names.sort()
+
+    return TraceWriter.ContainerWriter(os.path.join(output_dir, Globals.TRACE_CONTAINER_FILE),
+                                       node_names)
+
+
+def open_writer(output_dir, node_name, queue_type, trace_format, container=None):
+    """
+        Writer of the trace type 'queue_type' ('g', 'f', 'r', 'd', or 'q' for
+        the queue monitor) of the node 'node_name': a file in 'output_dir',
+        or a stream of 'container' with the container format
+    """
+
+    if queue_type == TraceWriter.QUEUE_TRACE:
+        kind = TraceWriter.KIND_QUEUE
+    else:
+        kind = TraceWriter.KIND_PKTS
+
+    if trace_format == Globals.TRACE_FORMAT_CONTAINER:
+        return container.stream(node_name, queue_type, kind)
+
+    if queue_type == TraceWriter.QUEUE_TRACE:
+        file_name = node_name + queue_suffix(trace_format)
+    else:
+        file_name = node_name + trace_suffix(queue_type, trace_format)
+
+    return TraceWriter.make_writer(os.path.join(output_dir, file_name), kind, trace_format)
+
+
+def stream_traces(network, output_dir, trace_format=Globals.TRACE_FORMAT_CSV):
+    """
+        Streams the packet traces and queue monitors of all nodes to files
+        in 'output_dir' while the simulation runs, a block at a time, so
+        that they need not be kept in memory (see close_streams()).
+        Returns the trace container with the container format, else None.
+    """
+
+    print(" [+] Streaming packet traces and queue monitors..")
+
+    container = None
+    if trace_format == Globals.TRACE_FORMAT_CONTAINER:
+        container = open_container(network, output_dir)
+
+    for node_name in network:
+
+        node = network[node_name]
+
+        for queue_type in ['g', 'f', 'r', 'd']:
+            node_trace(node, queue_type).stream_to(
+                open_writer(output_dir, node.name, queue_type, trace_format, container))
+
+        node.queue_mon.stream_to(
+            open_writer(output_dir, node.name, TraceWriter.QUEUE_TRACE, trace_format, container))
+
+    return container
+
+
+def close_streams(network, container=None):
+    """
+        Writes out what is left of the streamed traces and queue monitors,
+        and closes the trace 'container' if any (see stream_traces())
+    """
+
+    print(" [+] Closing packet trace and queue monitor streams..")
+
+    for node_name in network:
+
+        node = network[node_name]
+
+        for queue_type in ['g', 'f', 'r', 'd']:
+            node_trace(node, queue_type).close()
+
+        node.queue_mon.close()
+
+    if container is not None:
+        container.close()
+
+
+def load_binary_trace(file_path):
+    """
+        Loads a binary trace file (see TraceWriter). Returns a dictionary of
+        NumPy arrays keyed by column name; categorical columns are decoded
+        into arrays of labels.
+    """
+
+    fp = IO.open_for_reading(file_path, binary=True)
+    buf = fp.read()
+    IO.close_for_reading(fp)
+
+    magic, version = TraceWriter.FILE_HEADER.unpack_from(buf, 0)
+    if magic != TraceWriter.MAGIC or version > TraceWriter.VERSION:
+        Utils.error("'{:s}' is not a binary trace file".format(file_path))
+
+    # the column arrays of each chunk, read straight from the file buffer
+    parts = {}
+    labels = {}
+    offset = TraceWriter.FILE_HEADER.size
+
+    while offset < len(buf):
+        header, data_offset, offset = TraceWriter.decode_chunk_header(buf, offset)
+        if header["kind"] == TraceWriter.KIND_INDEX:
+            Utils.error("'{:s}' is a trace container: read it with TraceReader".format(file_path))
+        for column in header["columns"]:
+            part = np.frombuffer(buf, dtype=column["dtype"], count=header["rows"],
+                                 offset=data_offset + column["offset"])
+            parts.setdefault(column["name"], []).append(part)
+
+        # labels only ever grow, so the last ones decode every chunk
+        labels = header.get("labels", labels)
+
+    cols = {}
+    for name in parts:
+        cols[name] = np.concatenate(parts[name])
+        if name in labels:
+            cols[name] = TraceRecorder.decode(labels[name], cols[name])
+
+    return cols
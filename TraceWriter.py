@@ -0,0 +1,326 @@
+""" TraceWriter.py """
+
+import json
+import struct
+
+import numpy as np
+
+from . import Globals
+from . import IO
+from . import Utils
+from . import PacketIds
+from . import TraceRecorder
+
+
+# Trace kinds: packet traces (see TraceRecorder), queue monitors (see QueueMonitor),
+# and the index of a trace container
+KIND_PKTS = 'pkts'
+KIND_QUEUE = 'queue'
+KIND_INDEX = 'index'
+
+# Trace type of the queue monitors in a trace container, next to the
+# packet trace types 'g', 'f', 'r', 'd'
+QUEUE_TRACE = 'q'
+
+# Headers of the CSV trace files
+PKT_HEADER = "stime,timestamp,id,status,cpu_burst,no_rounds,source,dest,nhops,size,service_time\n"
+QUEUE_HEADER = "stime,queue_length\n"
+
+# Binary trace files: a file header (magic, format version) followed by
+# chunks. Each chunk is a little-endian uint32 length, a JSON chunk header
+# of that length, and the raw column data; the JSON header gives the
+# number of rows, the name, NumPy type and offset (from the start of the
+# column data) of every column, and the labels of the categorical columns.
+# Headers and columns are padded to ALIGNMENT bytes so columns can be read
+# in place. Every file starts with an empty chunk, so that the columns of
+# a trace without rows are known as well.
+#
+# A trace container holds the traces of all the nodes of a run in the same
+# layout: the chunk headers also name their node and trace type, and the
+# last chunk is an index (no columns) of the node names and of the chunk
+# offsets of every node and trace type. A trailer (index chunk offset,
+# magic) ends the file, so the index is found without a scan.
+MAGIC = b"PSIMTRC\0"
+VERSION = 1
+FILE_HEADER = struct.Struct("<8sI4x")
+CHUNK_LENGTH = struct.Struct("<I")
+TRAILER = struct.Struct("<Q8s")
+ALIGNMENT = 8
+
+# Queue monitor columns
+QUEUE_LENGTH = 'queue_length'
+
+
+def make_writer(file_path, kind, trace_format=Globals.TRACE_FORMAT_CSV):
+    """ Writer of the traces of kind 'kind' to the file 'file_path', in the format 'trace_format' """
+
+    if trace_format == Globals.TRACE_FORMAT_CSV:
+        if kind == KIND_PKTS:
+            writer = CsvTraceWriter(file_path, PKT_HEADER)
+        else:
+            writer = CsvTraceWriter(file_path, QUEUE_HEADER)
+    elif trace_format == Globals.TRACE_FORMAT_BINARY:
+        writer = BinaryTraceWriter(file_path, kind)
+    else:
+        Utils.error("Trace format '{:s}' not implemented".format(trace_format))
+
+    return writer
+
+
+def pkt_lines(cols, labels):
+    """
+        CSV lines of the packet trace columns 'cols', whose categorical
+        columns are decoded with 'labels' (see TraceRecorder)
+    """
+
+    # convert whole columns at once, then format the rows in a single pass
+    fields = [cols[Globals.STIME].tolist(),
+              cols[Globals.TIME_STAMP].tolist(),
+              PacketIds.format_ids(cols[Globals.ID]),
+              TraceRecorder.decode(labels[Globals.TYPE], cols[Globals.TYPE]).tolist(),
+              cols[Globals.CPU_BURST].tolist(),
+              cols[Globals.NO_ROUNDS].tolist(),
+              TraceRecorder.decode(labels[Globals.SOURCE], cols[Globals.SOURCE]).tolist(),
+              TraceRecorder.decode(labels[Globals.DEST_NODE], cols[Globals.DEST_NODE]).tolist(),
+              cols[Globals.NO_HOPS].tolist(),
+              cols[Globals.SIZE].tolist(),
+              cols[Globals.SERVICE_TIME].tolist()]
+
+    return map("{:f},{:f},{:s},{:s},{:f},{:d},{:s},{:s},{:d},{:d},{:f} \n".format, *fields)
+
+
+def queue_lines(times, lengths):
+    """ CSV lines of the queue monitor change points 'times', 'lengths' """
+
+    return map("{:f},{:d}\n".format, times, lengths)
+
+
+class CsvTraceWriter:
+    """
+        Writes the packet trace or the queue monitor of one node to a CSV
+        file, a chunk at a time. The file is only kept open while a chunk
+        is written, so that streaming all the nodes of a large model does
+        not hold thousands of files open.
+    """
+
+    def __init__(self, file_path, header):
+
+        self.file_path = file_path
+
+        fp = IO.open_for_writing(file_path)
+        fp.write(header)
+        IO.close_for_writing(fp)
+
+    def write_lines(self, lines):
+        """ Appends 'lines' to the file """
+
+        fp = IO.open_for_appending(self.file_path)
+        fp.writelines(lines)
+        IO.close_for_writing(fp)
+
+    def write_pkts(self, cols, labels):
+        """ Appends the packet trace columns 'cols' (see TraceRecorder) """
+
+        self.write_lines(pkt_lines(cols, labels))
+
+    def write_queue(self, times, lengths):
+        """ Appends the queue monitor change points 'times', 'lengths' """
+
+        self.write_lines(queue_lines(times, lengths))
+
+    def close(self):
+        """ Nothing left to write: the file is closed after every chunk """
+
+        pass
+
+
+def empty_columns(kind):
+    """ Columns without rows of a trace of kind 'kind' """
+
+    if kind == KIND_PKTS:
+        cols = {}
+        for name, dtype in TraceRecorder.COLUMNS:
+            cols[name] = np.empty(0, dtype=dtype)
+    else:
+        cols = {Globals.STIME: np.empty(0, dtype=np.float64),
+                QUEUE_LENGTH: np.empty(0, dtype=np.int64)}
+
+    return cols
+
+
+def padding(nbytes):
+    """ Number of bytes that pad 'nbytes' bytes to the alignment """
+
+    return -nbytes % ALIGNMENT
+
+
+def encode_chunk(kind, cols, labels=None, tags=None):
+    """
+        Binary chunk (see above) of the columns 'cols' (name -> NumPy array)
+        of a trace of kind 'kind', with the labels 'labels' of its categorical
+        columns and the extra header entries 'tags'
+    """
+
+    rows = 0
+    columns = []
+    data = []
+    offset = 0
+
+    for name in cols:
+        col = np.ascontiguousarray(cols[name])
+        rows = len(col)
+        columns.append({"name": name, "dtype": col.dtype.str, "offset": offset})
+        data.append(col.tobytes())
+        data.append(bytes(padding(col.nbytes)))
+        offset += col.nbytes + padding(col.nbytes)
+
+    header = {"kind": kind, "rows": rows, "columns": columns}
+    if labels is not None:
+        header["labels"] = labels
+    if tags is not None:
+        header.update(tags)
+
+    header_bytes = json.dumps(header).encode()
+    header_bytes += b" " * padding(CHUNK_LENGTH.size + len(header_bytes))
+
+    return CHUNK_LENGTH.pack(len(header_bytes)) + header_bytes + b"".join(data)
+
+
+def decode_chunk_header(buf, offset):
+    """
+        Decodes the chunk starting at byte 'offset' of 'buf', returns its
+        JSON header, the offset of its column data and the offset of the next chunk
+    """
+
+    (length,) = CHUNK_LENGTH.unpack_from(buf, offset)
+    data_offset = offset + CHUNK_LENGTH.size + length
+    header = json.loads(bytes(buf[offset + CHUNK_LENGTH.size:data_offset]))
+
+    end = data_offset
+    for column in header["columns"]:
+        nbytes = header["rows"] * np.dtype(column["dtype"]).itemsize
+        end = max(end, data_offset + column["offset"] + nbytes + padding(nbytes))
+
+    return header, data_offset, end
+
+
+class BinaryTraceWriter:
+    """
+        Writes the packet trace or the queue monitor of one node to a
+        binary trace file (see above), a chunk at a time. As CsvTraceWriter,
+        the file is only kept open while a chunk is written.
+    """
+
+    def __init__(self, file_path, kind):
+
+        self.file_path = file_path
+        self.kind = kind
+
+        fp = IO.open_for_writing(file_path, binary=True)
+        fp.write(FILE_HEADER.pack(MAGIC, VERSION))
+        fp.write(encode_chunk(kind, empty_columns(kind)))
+        IO.close_for_writing(fp)
+
+    def write_chunk(self, chunk):
+        """ Appends the binary chunk 'chunk' to the file """
+
+        fp = IO.open_for_appending(self.file_path, binary=True)
+        fp.write(chunk)
+        IO.close_for_writing(fp)
+
+    def write_pkts(self, cols, labels):
+        """ Appends the packet trace columns 'cols' (see TraceRecorder) """
+
+        if len(cols[Globals.STIME]) > 0:
+            self.write_chunk(encode_chunk(KIND_PKTS, cols, labels))
+
+    def write_queue(self, times, lengths):
+        """ Appends the queue monitor change points 'times', 'lengths' """
+
+        if len(times) > 0:
+            cols = {Globals.STIME: np.asarray(times, dtype=np.float64),
+                    QUEUE_LENGTH: np.asarray(lengths, dtype=np.int64)}
+            self.write_chunk(encode_chunk(KIND_QUEUE, cols))
+
+    def close(self):
+        """ Nothing left to write: the file is closed after every chunk """
+
+        pass
+
+
+class ContainerWriter:
+    """
+        Writes the traces of all the nodes of a run to a single trace
+        container file (see above). The file stays open until close(),
+        which writes the index.
+    """
+
+    def __init__(self, file_path, node_names):
+
+        self.file_path = file_path
+        self.node_names = list(node_names)
+
+        # node name -> trace type -> offsets of the chunks
+        self.index = {}
+
+        self.fp = IO.open_for_writing(file_path, binary=True)
+        self.fp.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self.offset = FILE_HEADER.size
+
+    def write_chunk(self, node_name, trace, chunk):
+        """ Appends the binary chunk 'chunk' of the trace type 'trace' of the node 'node_name' """
+
+        self.index.setdefault(node_name, {}).setdefault(trace, []).append(self.offset)
+        self.fp.write(chunk)
+        self.offset += len(chunk)
+
+    def stream(self, node_name, trace, kind):
+        """ Writer of the trace type 'trace' (of kind 'kind') of the node 'node_name' """
+
+        return ContainerStream(self, node_name, trace, kind)
+
+    def close(self):
+        """ Writes the index and the trailer, and closes the file """
+
+        tags = {"nodes": self.node_names, "index": self.index}
+        index_offset = self.offset
+        self.fp.write(encode_chunk(KIND_INDEX, {}, tags=tags))
+        self.fp.write(TRAILER.pack(index_offset, MAGIC))
+
+        IO.close_for_writing(self.fp)
+
+
+class ContainerStream:
+    """ Writes one trace of one node to a trace container (see ContainerWriter) """
+
+    def __init__(self, container, node_name, trace, kind):
+
+        self.container = container
+        self.tags = {"node": node_name, "trace": trace}
+
+        # the first, empty chunk gives the columns of the trace
+        self.write_chunk(encode_chunk(kind, empty_columns(kind), tags=self.tags))
+
+    def write_chunk(self, chunk):
+        """ Appends the binary chunk 'chunk' to the container """
+
+        self.container.write_chunk(self.tags["node"], self.tags["trace"], chunk)
+
+    def write_pkts(self, cols, labels):
+        """ Appends the packet trace columns 'cols' (see TraceRecorder) """
+
+        if len(cols[Globals.STIME]) > 0:
+            self.write_chunk(encode_chunk(KIND_PKTS, cols, labels, self.tags))
+
+    def write_queue(self, times, lengths):
+        """ Appends the queue monitor change points 'times', 'lengths' """
+
+        if len(times) > 0:
+            cols = {Globals.STIME: np.asarray(times, dtype=np.float64),
+                    QUEUE_LENGTH: np.asarray(lengths, dtype=np.int64)}
+            self.write_chunk(encode_chunk(KIND_QUEUE, cols, tags=self.tags))
+
+    def close(self):
+        """ Nothing to do: the container is closed once all its traces are written """
+
+        pass
@@ -5,11 +5,21 @@ import os
 import subprocess
 import random
 import string
+import itertools
+import math
 
-import networkx as nx
+import numpy as np
 
 from . import Globals
 from . import IO
+from . import PacketIds
+
+
+# Number of lines parsed at a time by int_edges()
+INT_EDGES_BLOCK = 65536
+
+# Number of steps of the numerical integration in t_quantile()
+T_QUANTILE_STEPS = 4096
 
 
 def benchmark2anx(input_file, output_file):
@@ -19,41 +29,145 @@ def benchmark2anx(input_file, output_file):
         unique edges to the file 'output_file'.
     """
 
-    # load file lines
-    lines = IO.file_lines(input_file)
+    # get the edges, a line at a time
+    edges = int_edges(IO.iter_file_lines(input_file))
 
-    # get the edges
-    edges = []
-    for line in lines:
-        fields = line.split()
-        edges.append((int(fields[0]), int(fields[1])))
-
-    # sanity check: a node must not be connected to itself
-    cntr = 0
-    for edge in edges:
-        if edge[0] == edge[1]:
-            cntr += 1
-            if cntr == 1:
-                error("node connected to itself")
-
-    # extract unique edges
-    unique_edges = []
-    for edge in edges:
-        edge_flip = (edge[1], edge[0])
-        if (edge not in unique_edges) and (edge_flip not in unique_edges):
-            unique_edges.append(edge)
+    # sanity check (a node must not be connected to itself), and unique edges
+    unique = unique_int_edges(edges)
 
     # write unique edges to a file
     fp = IO.open_for_writing(output_file)
-    for edge in unique_edges:
-        fp.write("{:d} {:d}\n".format(edge[0], edge[1]))
+    fp.writelines(map("{:d} {:d}\n".format, unique[:, 0].tolist(), unique[:, 1].tolist()))
     fp.close()
 
     print("\t Total number of edges read: {:d}".format(len(edges)))
-    print("\t {:d} unique edges saved as '{:s}'\n".format(len(unique_edges),
+    print("\t {:d} unique edges saved as '{:s}'\n".format(len(unique),
                                                           output_file))
 
 
+def edge_key(n1, n2):
+    """ Canonical key of the (undirected) edge between the nodes 'n1' and 'n2' """
+
+    if n2 < n1:
+        return (n2, n1)
+
+    return (n1, n2)
+
+
+def unique_edges(edges):
+    """
+        Takes an iterable of edges (node pairs) and removes the duplicate
+        edges, either way round, in a single pass with a set of edge keys
+        (see edge_key()). A node connected to itself is an error. Returns
+        the number of edges read and the list of unique edges, in order of
+        first appearance.
+    """
+
+    n_edges = 0
+    seen = set()
+    unique = []
+
+    for edge in edges:
+
+        n_edges += 1
+
+        if edge[0] == edge[1]:
+            error("Link connects node '{}' to itself".format(edge[0]))
+
+        key = edge_key(edge[0], edge[1])
+        if key not in seen:
+            seen.add(key)
+            unique.append(edge)
+
+    return n_edges, unique
+
+
+def int_edges(lines):
+    """
+        Takes an iterable of 'node node ...' lines of integer node names,
+        returns an E x 2 NumPy array of the first two fields of the lines.
+        Lines are parsed a block at a time by NumPy; a block whose lines
+        are not all 'node node' pairs with a single space between them
+        (e.g. with link weights) is parsed a line at a time.
+    """
+
+    blocks = []
+    lines = iter(lines)
+
+    while True:
+        block = list(itertools.islice(lines, INT_EDGES_BLOCK))
+        if len(block) == 0:
+            break
+        text = "\n".join(block)
+        values = []
+        if pair_lines(text, len(block)):
+            try:
+                values = np.fromstring(text, dtype=np.int64, sep=" ")
+            except ValueError:
+                pass
+        if len(values) != 2 * len(block):
+            values = int_edge_fields(block)
+        blocks.append(values)
+
+    if len(blocks) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    return np.concatenate(blocks).reshape(-1, 2)
+
+
+def pair_lines(text, n_lines):
+    """
+        Whether each of the 'n_lines' newline-separated lines of 'text'
+        (stripped, as read by IO.iter_file_lines()) has exactly one space,
+        that is two fields
+    """
+
+    chars = np.frombuffer(text.encode(), dtype=np.uint8)
+
+    # the line of every character, and the spaces on every line
+    rows = np.cumsum(chars == ord("\n"))
+    spaces = np.bincount(rows[chars == ord(" ")], minlength=n_lines)
+
+    return len(spaces) == n_lines and bool(np.all(spaces == 1))
+
+
+def int_edge_fields(lines):
+    """ Slow path of int_edges(): the first two fields of the lines 'lines', flattened """
+
+    values = np.zeros(2 * len(lines), dtype=np.int64)
+
+    for k, line in enumerate(lines):
+        fields = line.split()
+        try:
+            values[2 * k] = int(fields[0])
+            values[2 * k + 1] = int(fields[1])
+        except (ValueError, IndexError, OverflowError):
+            error("Link '{:s}' is not a pair of integer node names".format(line))
+
+    return values
+
+
+def unique_int_edges(edges):
+    """
+        Integer version of unique_edges(): takes an E x 2 NumPy array of
+        edges, returns the array of unique edges in order of first appearance
+    """
+
+    loops = np.flatnonzero(edges[:, 0] == edges[:, 1])
+    if len(loops) > 0:
+        error("Link connects node '{:d}' to itself".format(int(edges[loops[0], 0])))
+
+    # the first occurrences of the edge keys (lo, hi), as single integers if they fit
+    lo = np.minimum(edges[:, 0], edges[:, 1])
+    hi = np.maximum(edges[:, 0], edges[:, 1])
+    if len(edges) > 0 and 0 <= lo.min() and hi.max() < 2 ** 31:
+        _, first = np.unique(lo * (int(hi.max()) + 1) + hi, return_index=True)
+    else:
+        _, first = np.unique(np.stack([lo, hi], axis=1), axis=0, return_index=True)
+
+    return edges[np.sort(first)]
+
+
 def verify_input(model_edges, node_types, model_param):
     """ Verify model parameters """
 
@@ -97,27 +211,123 @@ def verify_input(model_edges, node_types, model_param):
     print("All good")
 
 
-def shortest_path_table(G):
+def adjacency_arrays(G, node_index, weight=None):
+    """
+        Adjacency of the graph 'G' in compressed sparse row form: the
+        ordinals (see 'node_index', name -> ordinal) of the neighbours of
+        the node of ordinal i are indices[indptr[i]:indptr[i + 1]], and the
+        lengths of the links to them weights[indptr[i]:indptr[i + 1]], the
+        link attribute 'weight' (1 for every link if 'weight' is None)
+    """
+
+    indptr = np.zeros(len(node_index) + 1, dtype=np.int64)
+    indices = []
+    weights = []
+
+    for node_name in node_index:
+        i = node_index[node_name]
+        indptr[i + 1] = len(G[node_name])
+        for m in G[node_name]:
+            indices.append(node_index[m])
+            weights.append(1.0 if weight is None else G[node_name][m][weight])
+
+    indptr = np.cumsum(indptr)
+    indices = np.array(indices, dtype=np.int64)
+    weights = np.array(weights, dtype=np.float64)
+
+    return indptr, indices, weights
+
+
+def link_positions(indptr, nodes):
+    """
+        Positions in the adjacency arrays (see adjacency_arrays()) of the
+        links leaving the node ordinals 'nodes', and the node each one leaves
+    """
+
+    starts = indptr[nodes]
+    counts = indptr[nodes + 1] - starts
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    return np.repeat(starts, counts) + offsets, np.repeat(nodes, counts)
+
+
+def bfs_distances(indptr, indices, dest, active=None):
+    """
+        Breadth-first search from the node of ordinal 'dest' (or from the
+        nearest of the node ordinals in the array 'dest') over the adjacency
+        arrays 'indptr', 'indices' (see adjacency_arrays()), using only the
+        links marked in the boolean array 'active' if given. Returns the
+        NumPy array of the hop count from every node to 'dest' (infinite if
+        'dest' cannot be reached).
+    """
+
+    dist = np.full(len(indptr) - 1, np.inf)
+    dist[dest] = 0.0
+
+    # expand a whole level of the search at once
+    frontier = np.atleast_1d(np.asarray(dest, dtype=np.int64))
+    level = 0
+
+    while len(frontier) > 0:
+
+        level += 1
+
+        # the links leaving the frontier, and the neighbours they lead to
+        links, _ = link_positions(indptr, frontier)
+        if active is not None:
+            links = links[active[links]]
+        neighbours = indices[links]
+
+        frontier = np.unique(neighbours[dist[neighbours] == np.inf])
+        dist[frontier] = level
+
+    return dist
+
+
+def on_path_links(indptr, indices, weights, dist, nodes=None, active=None):
     """
-        Calculate the table of shortest paths between all nodes.
-        The 'table' is actually a dictionary path_G{} whose keys
-        are tuples (n1, n2). The value of path_G[(n1,n2)] is the
-        next hop node on the shortest path from n1 -> n2.
+        Positions in the adjacency arrays (see adjacency_arrays()) of the
+        links that start a shortest path to a destination, given the path
+        lengths 'dist' to it of all nodes: the links leaving the node
+        ordinals 'nodes' (default: all nodes), optionally only those marked
+        in 'active', whose length plus the path length from their far end
+        equals the path length from their near end. Positions are sorted
+        by node, then in adjacency order.
     """
 
-    print(" [*] Calculating shortest paths")
+    if nodes is None:
+        links = np.arange(len(indices))
+        sources = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    else:
+        links, sources = link_positions(indptr, nodes)
+
+    # path lengths are sums of floats, so equal costs are equal up to rounding
+    near = dist[sources]
+    far = dist[indices[links]]
+    on_path = (weights[links] + far <= near * (1 + Globals.ROUTING_TOLERANCE)) & (far < near)
+    if active is not None:
+        on_path &= active[links]
 
-    path_G = {}
+    return links[on_path], sources[on_path]
 
-    for n1 in G.nodes():
-        for n2 in G.nodes():
-            if n1 != n2:
-                path_s = nx.shortest_path(G, source=n1, target=n2)
-                if (path_s[0] != n1) or (path_s[-1] != n2):
-                    error("This should never happen")
-                path_G[(n1, n2)] = path_s[1]
 
-    return path_G
+def next_hop_tree(indptr, indices, weights, dist, dest, active=None):
+    """
+        Next hop towards 'dest' (a node ordinal, or an array of them) of
+        every node, given the path lengths 'dist' to it (see on_path_links()):
+        the first link, in adjacency order, that starts a shortest path.
+        Returns a NumPy array of node ordinals ('dest' itself for 'dest',
+        -1 if 'dest' cannot be reached).
+    """
+
+    tree = np.full(len(indptr) - 1, -1, dtype=np.int32)
+    tree[dest] = dest
+
+    links, sources = on_path_links(indptr, indices, weights, dist, active=active)
+    nodes, first = np.unique(sources, return_index=True)
+    tree[nodes] = indices[links[first]]
+
+    return tree
 
 
 def gen_id(n=16):
@@ -137,7 +347,7 @@ def report(self_env_now, self_name, pkt, proc_queue, fname, verbose):
     """ Print packet report on stdout """
 
     print("\n  {:s}(): @{:.4f} NODE '{:s}'. Packet ID: '{:s}'"
-          .format(fname, self_env_now, self_name, pkt[Globals.ID]))
+          .format(fname, self_env_now, self_name, PacketIds.format_id(pkt.id)))
 
     print_pkt(pkt)
 
@@ -156,17 +366,18 @@ def report_queue(proc_queue):
 def print_pkt(pkt):
     """ Formats and prints packet on the stdout """
 
-    time_str = "t={:.4f}".format(pkt[Globals.TIME_STAMP])
-    id_str = "id='{:s}'".format(pkt[Globals.ID])
-    source_str = "source={:s}".format(pkt[Globals.SOURCE])
-    dest_str = "dest={:s}".format(pkt[Globals.DEST_NODE])
+    time_str = "t={:.4f}".format(pkt.time_stamp)
+    id_str = "id='{:s}'".format(PacketIds.format_id(pkt.id))
+    source_str = "source={:s}".format(pkt.source)
+    dest_str = "dest={:s}".format(pkt.dest_node)
     # status_str = "status={:s}".format(pkt[Globals.CURRENT_STATUS])                  # added by myself
     # priority_str = "priority={:s}".format(pkt[Globals.PRIORITY_LEVEL])              # added by myself
-    hop_str = "hop_node={:s}".format(pkt[Globals.HOP_NODE])
-    no_hops = "hops={:d}".format(pkt[Globals.NO_HOPS])
+    type_str = "type={:s}".format(pkt.type)
+    hop_str = "hop_node={:s}".format(pkt.hop_node)
+    no_hops = "hops={:d}".format(pkt.no_hops)
 
-    print("\t [ {:s} {:s} {:s} {:s} {:s} {:s} {:s} {:s} ]"
-          .format(time_str, id_str, source_str, dest_str, status_str, priority_str, hop_str, no_hops))
+    print("\t [ {:s} {:s} {:s} {:s} {:s} {:s} {:s} ]"
+          .format(time_str, id_str, source_str, dest_str, type_str, hop_str, no_hops))
 
 
 def strip_wsnl_list(items_in):
@@ -226,6 +437,52 @@ def version():
     print(" v{:d}.{:d}.{:d}\n".format(Globals.VERSION, Globals.REVISION, Globals.SUBREV))
 
 
+def t_quantile(p, df):
+    """
+        Quantile 'p' (0.5 <= p < 1) of Student's t distribution with 'df'
+        degrees of freedom, by bisection on its distribution function
+        (the integral of the density, by the midpoint rule)
+    """
+
+    # density constant, and the distribution function at x >= 0
+    c = math.exp(math.lgamma((df + 1) / 2.0) - math.lgamma(df / 2.0)) / math.sqrt(df * math.pi)
+
+    def cdf(x):
+        mid = (np.arange(T_QUANTILE_STEPS) + 0.5) * (x / T_QUANTILE_STEPS)
+        return 0.5 + x * c * np.mean((1.0 + mid * mid / df) ** (-(df + 1) / 2.0))
+
+    hi = 1.0
+    while cdf(hi) < p:
+        hi *= 2.0
+
+    lo = 0.0
+    for _ in range(60):
+        mid = (lo + hi) / 2.0
+        if cdf(mid) < p:
+            lo = mid
+        else:
+            hi = mid
+
+    return (lo + hi) / 2.0
+
+
+def mean_ci(values, confidence=Globals.CONFIDENCE_LEVEL):
+    """
+        Mean of 'values' and the half width of its 'confidence' confidence
+        interval (Student's t; NaN for fewer than two values)
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    mean = float(np.mean(values)) if len(values) > 0 else math.nan
+
+    if len(values) < 2:
+        return mean, math.nan
+
+    std_err = float(np.std(values, ddof=1)) / math.sqrt(len(values))
+
+    return mean, t_quantile((1.0 + confidence) / 2.0, len(values) - 1) * std_err
+
+
 def error(message=None):
     """ Generic error function """
 